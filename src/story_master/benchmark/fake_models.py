@@ -0,0 +1,155 @@
+import asyncio
+import hashlib
+import random
+import re
+import time
+from typing import Any
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+OBJECT_NAMES = [
+    "Oak tree",
+    "Granite boulder",
+    "Berry bush",
+    "Small pond",
+    "Iron ore vein",
+    "Birch tree",
+    "Mushroom patch",
+    "Fallen log",
+    "Reed bed",
+    "Flint stones",
+]
+
+
+def get_fake_embeddings(size: int = 256) -> DeterministicFakeEmbedding:
+    return DeterministicFakeEmbedding(size=size)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Offline stand-in for the chat model.
+    Recognizes every prompt of the project and answers with valid tool calls or XML.
+    Answers are seeded by the prompt, so runs are deterministic.
+    An optional latency simulates the model response time.
+    """
+
+    latency: float = 0.0
+    objects_per_patch: int = 4
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-story-master"
+
+    def bind_tools(self, tools: list, **kwargs: Any):
+        tool_names = [
+            convert_to_openai_tool(tool)["function"]["name"] for tool in tools
+        ]
+        return self.bind(tool_names=tool_names)
+
+    def _create_tool_call(
+        self, messages: list[BaseMessage], tool_names: list[str]
+    ) -> AIMessage:
+        last_message = messages[-1]
+        if "select_action" in tool_names:
+            if isinstance(last_message, ToolMessage):
+                name, args = "select_action", {}
+            else:
+                name, args = "get_nearby_characters", {}
+        else:
+            target_ids = []
+            for message in messages:
+                if isinstance(message, ToolMessage):
+                    target_ids = re.findall(r"ID: (\d+)", str(message.content))
+            target_id = int(target_ids[0]) if target_ids else 0
+            name = "speak_action"
+            args = {"speech": "Greetings, traveler.", "another_character_id": target_id}
+        tool_call = {"name": name, "args": args, "id": f"call_{len(messages)}"}
+        return AIMessage(content="", tool_calls=[tool_call])
+
+    def _create_text(self, prompt: str) -> str:
+        seed = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8], 16)
+        rng = random.Random(seed)
+        if "<Id>Object id</Id>" in prompt:
+            placeable = prompt.split("-Placeable objects-")[1]
+            object_ids = re.findall(r"id: (\d+)", placeable)
+            return "\n".join(
+                f"<Object><Id>{object_id}</Id>"
+                f"<X>{rng.randint(-2, 2)}</X><Y>{rng.randint(-2, 2)}</Y></Object>"
+                for object_id in object_ids
+            )
+        if "<Width>Object width</Width>" in prompt:
+            names = re.findall(r"<Object>(.*?)</Object>", prompt.split("-Objects-")[1])
+            return "\n".join(
+                f"<Object><Name>{name}</Name>"
+                f"<Description>A {name.lower()} in the wild.</Description>"
+                f"<Width>{rng.randint(1, 3)}</Width><Height>{rng.randint(1, 3)}</Height>"
+                "</Object>"
+                for name in names
+            )
+        if "<Object>Second object name</Object>" in prompt:
+            names = rng.sample(OBJECT_NAMES, self.objects_per_patch)
+            return "\n".join(f"<Object>{name}</Object>" for name in names)
+        if "<X>Region x coordinate</X>" in prompt:
+            return "\n".join(
+                f"<Region><Name>Region {i}</Name>"
+                f"<Description>Wild lands number {i}.</Description>"
+                f"<X>{i}</X><Y>{i}</Y></Region>"
+                for i in range(3)
+            )
+        if "<Summary>Summary</Summary>" in prompt:
+            information = prompt.split("-Information-")[1].split("########")[0]
+            return f"<Summary>{' '.join(information.split())[:200]}</Summary>"
+        if "<Gender>Gender</Gender>" in prompt:
+            return (
+                "<Gender>female</Gender><Age>30</Age>"
+                f"<Name>Settler {rng.randint(0, 10_000)}</Name>"
+                "<Appearance>A tall settler in a fur coat.</Appearance>"
+            )
+        if "<Output>New character description</Output>" in prompt:
+            return "<Output>A wandering hunter from the northern plains.</Output>"
+        return ""
+
+    def _create_message(
+        self, messages: list[BaseMessage], tool_names: list[str] | None
+    ) -> ChatResult:
+        if tool_names:
+            message = self._create_tool_call(messages, tool_names)
+        else:
+            prompt = "\n".join(str(message.content) for message in messages)
+            message = AIMessage(content=self._create_text(prompt))
+        prompt_tokens = sum(len(str(message.content)) for message in messages) // 4
+        completion_tokens = len(str(message.content)) // 4 + len(message.tool_calls)
+        message.usage_metadata = {
+            "input_tokens": prompt_tokens,
+            "output_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: Any = None,
+        tool_names: list[str] | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._create_message(messages, tool_names)
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: Any = None,
+        tool_names: list[str] | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._create_message(messages, tool_names)
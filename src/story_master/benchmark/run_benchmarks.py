@@ -0,0 +1,423 @@
+import argparse
+import contextlib
+import functools
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from story_master.benchmark.fake_models import FakeChatModel, get_fake_embeddings
+from story_master.distributed.coordinator import SimulationCoordinator
+from story_master.entities.character import Gender, Settler
+from story_master.entities.event import Event, EventType, SimReference
+from story_master.entities.handlers.event_handler import EventHandler
+from story_master.entities.handlers.memory_handler import MemoryHandler
+from story_master.entities.handlers.storage_handler import StorageHandler
+from story_master.entities.handlers.summary_handler import SummaryHandler
+from story_master.entities.inventory import Inventory
+from story_master.entities.location import Object, Position, Region
+from story_master.entities.memory import MemoryTag, NewMemory
+from story_master.entities.sim import Sim
+from story_master.generators.environment_generation.map_creator import MapCreator
+from story_master.log import logger
+from story_master.llm_client import MetricsCallbackHandler
+from story_master.metrics import metrics
+from story_master.settings import (
+    DistributedSettings,
+    LLMCacheSettings,
+    RouterBatchSettings,
+    Settings,
+    SnapshotSettings,
+    StorageSettings,
+)
+from story_master.sim_agent.lod_scheduler import LodScheduler
+from story_master.sim_agent.tick_runner import SimTickRunner
+
+BENCHMARKS = [
+    "sim_graph",
+    "lod_tick",
+    "batched_tick",
+    "generate_patch",
+    "generate_area",
+    "storage_save",
+    "storage_load",
+    "event_broadcast",
+    "event_dispatch",
+    "memory_insert",
+    "distributed_tick",
+]
+
+
+def create_settings(
+    directory: Path,
+    workers: int,
+    memory_backend: str = "chroma",
+    snapshot_format: str = "binary",
+) -> Settings:
+    return Settings(
+        characters_storage_path=directory / "characters.json",
+        map_storage_path=directory / "map.json",
+        map_shards_path=directory / "map",
+        game_storage_path=directory / "game.json",
+        storage=StorageSettings(
+            memory_backend=memory_backend,
+            data_file_path=directory / "db",
+            memory_index_path=directory / "memory_index",
+        ),
+        llm_cache=LLMCacheSettings(enabled=False),
+        snapshot=SnapshotSettings(format=snapshot_format),
+        distributed=DistributedSettings(
+            workers=workers, run_directory=directory / "workers"
+        ),
+        map_generation_workers=workers,
+    )
+
+
+def populate_world(
+    storage_handler: StorageHandler,
+    sims: int,
+    objects: int,
+    world_size: int,
+    regions: int = 1,
+) -> Region:
+    """
+    Objects are placed in the first region, sims are spread over all regions.
+    """
+    rng = random.Random(0)
+    for region_id in range(regions):
+        storage_handler.map.locations[region_id] = Region(
+            id=region_id,
+            name="Benchmark region",
+            description="Flat grassland",
+            position=Position(location_id=None, x=region_id, y=0),
+        )
+    region = storage_handler.map.locations[0]
+    for object_id in range(objects):
+        region.add_object(
+            Object(
+                id=object_id,
+                name="Rock",
+                description="A rock",
+                position=Position(
+                    location_id=region.id,
+                    x=rng.randint(-world_size, world_size),
+                    y=rng.randint(-world_size, world_size),
+                ),
+                width=rng.randint(1, 3),
+                height=rng.randint(1, 3),
+            )
+        )
+    for sim_id in range(sims):
+        storage_handler.add_sim(
+            Sim(
+                id=sim_id,
+                character=Settler(
+                    name=f"Settler {sim_id}",
+                    appearance="A settler in a fur coat",
+                    gender=Gender.OTHER,
+                    age=30,
+                ),
+                position=Position(
+                    location_id=sim_id % regions,
+                    x=rng.randint(-world_size, world_size),
+                    y=rng.randint(-world_size, world_size),
+                ),
+                inventory=Inventory(),
+            )
+        )
+    return region
+
+
+def measure(name: str, operations: int, function) -> dict:
+    start = time.perf_counter()
+    function()
+    seconds = time.perf_counter() - start
+    logger.info(f"{name}: {seconds:.4f} s for {operations} operations")
+    return {
+        "seconds": seconds,
+        "operations": operations,
+        "operations_per_second": operations / seconds if seconds > 0 else None,
+    }
+
+
+def run_benchmarks(args: argparse.Namespace, directory: Path) -> dict:
+    settings = create_settings(
+        directory, args.workers, args.memory_backend, args.snapshot_format
+    )
+    callbacks = [MetricsCallbackHandler()] if args.metrics else None
+    client = FakeChatModel(latency=args.latency, callbacks=callbacks)
+    storage_handler = StorageHandler(settings)
+    region = populate_world(storage_handler, args.sims, args.objects, args.world_size)
+    results = dict()
+
+    if "sim_graph" in args.benchmarks:
+        event_handler = EventHandler(storage_handler)
+        tick_runner = SimTickRunner(
+            client,
+            storage_handler,
+            event_handler,
+            SummaryHandler(client),
+            args.concurrency,
+            settings.sim_history_token_budget,
+            settings.sim_router_retry_budget,
+        )
+        results["sim_graph"] = measure(
+            "sim_graph", args.sims, lambda: tick_runner.run_tick()
+        )
+
+    if "lod_tick" in args.benchmarks:
+        # One focus point in the middle of the world, the far sims go dormant
+        scheduler = LodScheduler(storage_handler, settings.lod)
+        scheduler.set_focus_points([Position(location_id=region.id, x=0, y=0)])
+        tick_runner = SimTickRunner(
+            client,
+            storage_handler,
+            EventHandler(storage_handler),
+            SummaryHandler(client),
+            args.concurrency,
+            settings.sim_history_token_budget,
+            settings.sim_router_retry_budget,
+            scheduler,
+        )
+        results["lod_tick"] = measure(
+            "lod_tick", args.sims, lambda: tick_runner.run_tick()
+        )
+
+    if "batched_tick" in args.benchmarks:
+        # Router calls of the concurrent sims share requests to the model
+        tick_runner = SimTickRunner(
+            client,
+            storage_handler,
+            EventHandler(storage_handler),
+            SummaryHandler(client),
+            args.concurrency,
+            settings.sim_history_token_budget,
+            settings.sim_router_retry_budget,
+            batch_settings=RouterBatchSettings(
+                enabled=True, max_batch_size=args.concurrency
+            ),
+        )
+        results["batched_tick"] = measure(
+            "batched_tick", args.sims, lambda: tick_runner.run_tick()
+        )
+
+    if {"generate_patch", "generate_area"} & set(args.benchmarks):
+        map_creator = MapCreator(
+            client, storage_handler, SummaryHandler(client), args.workers
+        )
+        if "generate_patch" in args.benchmarks:
+            center = Position(location_id=region.id, x=args.world_size + 20, y=0)
+            results["generate_patch"] = measure(
+                "generate_patch", 1, lambda: map_creator.generate_patch(center)
+            )
+        if "generate_area" in args.benchmarks:
+            center = Position(location_id=region.id, x=-args.world_size - 50, y=0)
+            results["generate_area"] = measure(
+                "generate_area",
+                1,
+                lambda: map_creator.generate_area(center, args.area_radius),
+            )
+
+    if "storage_save" in args.benchmarks:
+        results["storage_save"] = measure(
+            "storage_save",
+            1,
+            lambda: (storage_handler.save_map(), storage_handler.save_characters()),
+        )
+        new_object_id = max(region.objects.keys()) + 1
+        region.add_object(
+            Object(
+                id=new_object_id,
+                name="Rock",
+                description="A new rock",
+                position=Position(location_id=region.id, x=0, y=0),
+                width=1,
+                height=1,
+            )
+        )
+        results["storage_save_incremental"] = measure(
+            "storage_save_incremental", 1, storage_handler.save_map
+        )
+
+    if "storage_load" in args.benchmarks:
+        storage_handler.save_map()
+        storage_handler.save_characters()
+
+        def load():
+            loaded_storage_handler = StorageHandler(settings)
+            loaded_storage_handler.get_location(region.id)
+
+        results["storage_load"] = measure("storage_load", 1, load)
+
+    if {"event_broadcast", "event_dispatch"} & set(args.benchmarks):
+        event_handler = EventHandler(storage_handler)
+        rng = random.Random(1)
+        events = [
+            Event(
+                type=EventType.OBSERVATION,
+                description="A loud noise",
+                position=Position(
+                    location_id=region.id,
+                    x=rng.randint(-args.world_size, args.world_size),
+                    y=rng.randint(-args.world_size, args.world_size),
+                ),
+                radius=5,
+                source=SimReference(sim_id=0),
+                timestamp=storage_handler.game_storage.current_time,
+            )
+            for _ in range(args.events)
+        ]
+
+        def broadcast():
+            for event in events:
+                event_handler.broadcast_event(event)
+
+        def dispatch():
+            for event in events:
+                event_handler.queue_event(event)
+            event_handler.flush()
+
+        if "event_broadcast" in args.benchmarks:
+            results["event_broadcast"] = measure(
+                "event_broadcast", args.events, broadcast
+            )
+        if "event_dispatch" in args.benchmarks:
+            results["event_dispatch"] = measure("event_dispatch", args.events, dispatch)
+
+    if "memory_insert" in args.benchmarks:
+        memory_handler = MemoryHandler(
+            get_fake_embeddings(), settings.storage, storage_handler
+        )
+        memories = [
+            NewMemory(
+                memory_owner_id=i % max(args.sims, 1),
+                content=f"I noticed something interesting number {i}",
+                tag=MemoryTag.OBJECT,
+            )
+            for i in range(args.memories)
+        ]
+        results["memory_insert"] = measure(
+            "memory_insert",
+            args.memories,
+            lambda: memory_handler.add_memories(memories),
+        )
+
+    if "distributed_tick" in args.benchmarks:
+        # A separate world with one region of sims per worker
+        distributed_settings = create_settings(
+            directory / "distributed", args.workers, args.memory_backend
+        )
+        distributed_storage_handler = StorageHandler(distributed_settings)
+        populate_world(
+            distributed_storage_handler,
+            args.sims,
+            0,
+            args.world_size,
+            regions=args.workers,
+        )
+        coordinator = SimulationCoordinator(
+            distributed_settings,
+            distributed_storage_handler,
+            functools.partial(FakeChatModel, latency=args.latency),
+        )
+        coordinator.start()
+        try:
+            # The first tick waits for the workers to import their modules
+            results["distributed_first_tick"] = measure(
+                "distributed_first_tick", args.sims, coordinator.run_tick
+            )
+            results["distributed_tick"] = measure(
+                "distributed_tick", args.sims, coordinator.run_tick
+            )
+        finally:
+            coordinator.stop()
+    return results
+
+
+def get_commit() -> str | None:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@contextlib.contextmanager
+def stdout_to_stderr():
+    """
+    Sends everything printed by the benchmarked code to stderr, also from
+    the worker processes, so stdout holds only the report.
+    """
+    sys.stdout.flush()
+    stdout_fd = os.dup(1)
+    os.dup2(2, 1)
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        os.dup2(stdout_fd, 1)
+        os.close(stdout_fd)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Runs offline benchmarks with fake chat and embedding models."
+    )
+    parser.add_argument(
+        "--benchmarks", nargs="+", choices=BENCHMARKS, default=BENCHMARKS
+    )
+    parser.add_argument("--sims", type=int, default=50)
+    parser.add_argument("--objects", type=int, default=10_000)
+    parser.add_argument("--world-size", type=int, default=200)
+    parser.add_argument("--area-radius", type=int, default=11)
+    parser.add_argument("--events", type=int, default=1_000)
+    parser.add_argument("--memories", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument(
+        "--memory-backend", choices=["chroma", "numpy"], default="chroma"
+    )
+    parser.add_argument(
+        "--snapshot-format", choices=["json", "binary"], default="binary"
+    )
+    parser.add_argument("--output", type=Path, default=None)
+    parser.add_argument(
+        "--metrics",
+        action="store_true",
+        help="Adds per operation latency and token metrics to the report",
+    )
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    metrics.enabled = args.metrics
+    with stdout_to_stderr(), tempfile.TemporaryDirectory() as directory:
+        results = run_benchmarks(args, Path(directory))
+
+    report = {
+        "commit": get_commit(),
+        "created_at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "parameters": {
+            key: value for key, value in vars(args).items() if key != "output"
+        },
+        "results": results,
+    }
+    if args.metrics:
+        report["metrics"] = metrics.to_dict()
+    report_json = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(report_json, encoding="utf-8")
+    print(report_json)
+
+
+if __name__ == "__main__":
+    main()
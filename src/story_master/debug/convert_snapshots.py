@@ -0,0 +1,42 @@
+import argparse
+
+from story_master.entities.handlers.map_shards import MapShardStore
+from story_master.entities.handlers.snapshot import SnapshotCodec
+from story_master.entities.handlers.storage_handler import CharacterStorage
+from story_master.settings import Settings
+
+
+def convert_snapshots(snapshot_format: str):
+    """
+    Rewrites the saved characters and map shards in the given snapshot format.
+    Both formats are read, so this also converts binary snapshots back to json.
+    """
+    settings = Settings()
+    snapshot_settings = settings.snapshot.model_copy(update={"format": snapshot_format})
+
+    characters_codec = SnapshotCodec(CharacterStorage, snapshot_settings)
+    character_storage = characters_codec.read(settings.characters_storage_path)
+    if character_storage is not None:
+        # The journal is replayed over either format, so it is kept
+        characters_codec.write(settings.characters_storage_path, character_storage)
+
+    store = MapShardStore(
+        settings.map_shards_path,
+        settings.journal_compaction_records,
+        snapshot_settings,
+    )
+    location_ids = store.list_location_ids()
+    for location_id in location_ids:
+        # Folds the shard journal into the new snapshot
+        store.write(store.load(location_id))
+    print(
+        f"Converted characters and {len(location_ids)} locations to {snapshot_format}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Converts saves between json files and binary snapshots."
+    )
+    parser.add_argument("format", choices=["json", "binary"])
+    convert_snapshots(parser.parse_args().format)
@@ -2,12 +2,12 @@ from story_master.llm_client import get_embeddings_client
 from story_master.settings import Settings
 from story_master.entities.handlers.storage_handler import StorageHandler
 from story_master.entities.handlers.memory_handler import MemoryHandler
-from story_master.entities.memory import MemoryTag
+from story_master.entities.memory import MemoryTag, NewMemory
 
 
 def generate_memories():
     settings = Settings()
-    embeddings_client = get_embeddings_client()
+    embeddings_client = get_embeddings_client(settings)
 
     storage_handler = StorageHandler(settings)
 
@@ -28,12 +28,24 @@ def generate_memories():
         "She accepted the offer. We sat silently for a while, just the crackling of flame between us",
     ]
 
+    memories = []
     for i in range(len(character_0_lines)):
         line_0 = character_0_lines[i]
         line_1 = character_1_lines[i]
-        memory_handler.add_memory(
-            0, line_0, MemoryTag.RELATIONSHIP, related_entity_id=1
+        memories.append(
+            NewMemory(
+                memory_owner_id=0,
+                content=line_0,
+                tag=MemoryTag.RELATIONSHIP,
+                related_entity_id=1,
+            )
         )
-        memory_handler.add_memory(
-            1, line_1, MemoryTag.RELATIONSHIP, related_entity_id=0
+        memories.append(
+            NewMemory(
+                memory_owner_id=1,
+                content=line_1,
+                tag=MemoryTag.RELATIONSHIP,
+                related_entity_id=0,
+            )
         )
+    memory_handler.add_memories(memories)
@@ -0,0 +1,22 @@
+import time
+
+start = time.perf_counter()
+from story_master.engine import Engine  # noqa: E402
+
+
+def report_startup():
+    """
+    Loads the saved state without starting the LLM subsystems.
+    Run with python -X importtime for the time of every imported module.
+    """
+    import_seconds = time.perf_counter() - start
+    engine = Engine()
+    npc_characters = engine.storage_handler.character_storage.npc_characters
+    locations = engine.storage_handler.map.locations
+    print(f"Saved state: {len(npc_characters)} sims, {len(locations)} locations")
+    print(f"engine import: {import_seconds:.3f} s")
+    print(engine.get_startup_report())
+
+
+if __name__ == "__main__":
+    report_startup()
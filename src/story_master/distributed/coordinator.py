@@ -0,0 +1,275 @@
+import multiprocessing
+import shutil
+import time
+from collections import Counter, defaultdict
+from collections.abc import Callable
+
+from langchain_core.language_models.chat_models import BaseChatModel
+
+from story_master.distributed.message_bus import MessageBus
+from story_master.distributed.messages import (
+    RegionAssignment,
+    StopCommand,
+    TickCommand,
+    TickReport,
+    WorkerFailed,
+    WorkerStopped,
+)
+from story_master.distributed.region_worker import run_worker
+from story_master.entities.event import Event
+from story_master.entities.handlers.memory_handler import MemoryHandler
+from story_master.entities.handlers.storage_handler import StorageHandler
+from story_master.entities.location import Position
+from story_master.entities.memory import NewMemory
+from story_master.entities.sim import Sim
+from story_master.log import logger
+from story_master.metrics import timed
+from story_master.settings import Settings
+
+# Seconds between checks, that the workers are still alive
+WORKER_POLL_INTERVAL = 1.0
+# Seconds, that the stopped workers get to exit before they are terminated
+WORKER_JOIN_TIMEOUT = 5.0
+
+
+def assign_locations(
+    location_ids: list[int], sim_counts: Counter, worker_count: int
+) -> RegionAssignment:
+    """
+    Gives the locations with the most sims first to the worker with the fewest sims,
+    so every worker gets a similar share of the decisions.
+    """
+    worker_loads = [0] * worker_count
+    owners = dict()
+    for location_id in sorted(location_ids, key=lambda item: (-sim_counts[item], item)):
+        worker_id = min(range(worker_count), key=lambda item: worker_loads[item])
+        owners[location_id] = worker_id
+        worker_loads[worker_id] += sim_counts[location_id]
+    return RegionAssignment(worker_count=worker_count, owners=owners)
+
+
+class SimulationCoordinator:
+    """
+    Splits the world by location across worker processes and runs them in lockstep.
+    Every tick the coordinator sends each worker the game time together with the events
+    and sims addressed to its locations, and waits for the reports of all workers
+    before the clock advances. Events and sims, that leave the locations of a worker,
+    are delivered at the start of the next tick.
+    While the workers run they own the sims, the storage of the coordinator
+    gets them back when the run stops.
+    """
+
+    def __init__(
+        self,
+        settings: Settings,
+        storage_handler: StorageHandler,
+        client_factory: Callable[[], BaseChatModel],
+        memory_handler: MemoryHandler | None = None,
+    ):
+        self.settings = settings
+        self.distributed_settings = settings.distributed
+        self.storage_handler = storage_handler
+        self.client_factory = client_factory
+        self.memory_handler = memory_handler
+
+        self.assignment: RegionAssignment | None = None
+        self.bus: MessageBus | None = None
+        self.processes: list[multiprocessing.Process] = []
+        self.tick = 0
+        # Sent to the level of detail schedulers of the workers every tick
+        self.focus_points: list[Position] = []
+        self.pending_events: dict[int, list[Event]] = defaultdict(list)
+        self.pending_migrations: dict[int, list[Sim]] = defaultdict(list)
+
+    @property
+    def worker_count(self) -> int:
+        return self.distributed_settings.workers
+
+    def _get_worker_settings(self, worker_id: int) -> Settings:
+        directory = self.distributed_settings.run_directory / f"worker_{worker_id}"
+        # Sims of a previous run were returned to the main storage when it stopped
+        shutil.rmtree(directory, ignore_errors=True)
+        directory.mkdir(parents=True)
+        return self.settings.model_copy(
+            update={
+                "characters_storage_path": directory / "characters.json",
+                "game_storage_path": directory / "game.json",
+            }
+        )
+
+    def start(self) -> None:
+        # The workers read the map shards and get the sims, so both must be on disk
+        self.storage_handler.save_map()
+        self.storage_handler.save_characters()
+
+        npc_characters = self.storage_handler.character_storage.npc_characters
+        sim_counts = Counter(
+            sim.position.location_id for sim in npc_characters.values()
+        )
+        self.assignment = assign_locations(
+            list(self.storage_handler.map.locations), sim_counts, self.worker_count
+        )
+        for sim in npc_characters.values():
+            owner = self.assignment.get_owner(sim.position.location_id)
+            self.pending_migrations[owner].append(sim)
+
+        # Spawned, so workers don't inherit the threads and connections of this process
+        context = multiprocessing.get_context("spawn")
+        self.bus = MessageBus(context, self.worker_count)
+        for worker_id in range(self.worker_count):
+            process = context.Process(
+                target=run_worker,
+                args=(
+                    worker_id,
+                    self._get_worker_settings(worker_id),
+                    self.assignment,
+                    self.client_factory,
+                    self.bus.get_endpoint(worker_id),
+                ),
+                name=f"region-worker-{worker_id}",
+                daemon=True,
+            )
+            process.start()
+            self.processes.append(process)
+        logger.info(
+            f"Started {self.worker_count} workers for "
+            f"{len(self.assignment.owners)} locations and {len(npc_characters)} sims"
+        )
+
+    def _get_exited_workers(self, replied_ids: set[int]) -> set[int]:
+        return {
+            worker_id
+            for worker_id, process in enumerate(self.processes)
+            if worker_id not in replied_ids and process.exitcode is not None
+        }
+
+    def _collect(self, message_type: type) -> list:
+        """
+        Waits for one message of every worker, ordered by worker id.
+        Between short polls the processes are checked, so a worker, that was killed
+        or crashed without reporting, fails the run right away.
+        """
+        messages = []
+        replied_ids = set()
+        exited_ids = set()
+        deadline = time.monotonic() + self.distributed_settings.message_timeout
+        while len(messages) < self.worker_count:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                missing_ids = sorted(set(range(self.worker_count)) - replied_ids)
+                raise TimeoutError(
+                    f"Workers {missing_ids} didn't reply in "
+                    f"{self.distributed_settings.message_timeout} seconds"
+                )
+            try:
+                message = self.bus.receive(min(WORKER_POLL_INTERVAL, remaining))
+            except TimeoutError:
+                # The last message of an exited worker can still be in the pipe,
+                # it has failed only if the next poll brings nothing either
+                newly_exited_ids = self._get_exited_workers(replied_ids)
+                failed_ids = newly_exited_ids & exited_ids
+                if failed_ids:
+                    worker_id = min(failed_ids)
+                    raise RuntimeError(
+                        f"Worker {worker_id} exited with code "
+                        f"{self.processes[worker_id].exitcode} without replying"
+                    )
+                exited_ids = newly_exited_ids
+                continue
+            if isinstance(message, WorkerFailed):
+                raise RuntimeError(
+                    f"Worker {message.worker_id} failed: {message.error}"
+                )
+            if not isinstance(message, message_type):
+                raise RuntimeError(f"Unexpected message from a worker: {message}")
+            messages.append(message)
+            replied_ids.add(message.worker_id)
+        return sorted(messages, key=lambda message: message.worker_id)
+
+    def _store_memories(self, memories: list[NewMemory]) -> None:
+        if not memories:
+            return
+        if self.memory_handler is None:
+            logger.warning(f"Dropping {len(memories)} unread events of full inboxes")
+            return
+        self.memory_handler.add_memories(memories)
+
+    @timed("distributed.tick")
+    def run_tick(self) -> list[TickReport]:
+        game_storage = self.storage_handler.game_storage
+        for worker_id in range(self.worker_count):
+            command = TickCommand(
+                tick=self.tick,
+                current_time=game_storage.current_time,
+                focus_points=self.focus_points,
+                events=self.pending_events.pop(worker_id, []),
+                migrations=self.pending_migrations.pop(worker_id, []),
+            )
+            self.bus.send(worker_id, command)
+        reports = self._collect(TickReport)
+
+        memories = []
+        for report in reports:
+            for event in report.events:
+                owner = self.assignment.get_owner(event.position.location_id)
+                self.pending_events[owner].append(event)
+            for sim in report.migrations:
+                owner = self.assignment.get_owner(sim.position.location_id)
+                self.pending_migrations[owner].append(sim)
+            memories.extend(report.memories)
+        self._store_memories(memories)
+        if self.memory_handler is not None:
+            self.memory_handler.flush_if_due()
+
+        self.tick += 1
+        game_storage.current_time += self.distributed_settings.tick_duration
+        self.storage_handler.save_game()
+        logger.info(
+            f"Tick {self.tick}: {sum(report.sim_count for report in reports)} sims, "
+            f"slowest worker {max(report.seconds for report in reports):.3f} s"
+        )
+        return reports
+
+    def run(self, ticks: int) -> None:
+        for _ in range(ticks):
+            self.run_tick()
+
+    def stop(self) -> None:
+        """
+        Delivers what is still in flight, takes the sims back from the workers
+        and saves them to the main storage.
+        """
+        if self.bus is None:
+            return
+        try:
+            for worker_id in range(self.worker_count):
+                command = StopCommand(
+                    events=self.pending_events.pop(worker_id, []),
+                    migrations=self.pending_migrations.pop(worker_id, []),
+                )
+                self.bus.send(worker_id, command)
+            results = self._collect(WorkerStopped)
+            for result in results:
+                for sim in result.sims:
+                    self.storage_handler.add_sim(sim)
+                self._store_memories(result.memories)
+            self.storage_handler.save_characters()
+            # The workers have written the shards of their locations
+            self.storage_handler.map.locations.unload()
+        finally:
+            deadline = time.monotonic() + WORKER_JOIN_TIMEOUT
+            for process in self.processes:
+                process.join(timeout=max(0.0, deadline - time.monotonic()))
+                if process.is_alive():
+                    logger.error(f"Terminating {process.name}")
+                    process.terminate()
+            self.bus.close()
+            self.bus = None
+            self.processes = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
@@ -0,0 +1,51 @@
+import queue
+from multiprocessing.context import BaseContext
+
+from pydantic import BaseModel
+
+
+class WorkerEndpoint:
+    """
+    The end of the message bus, that a worker process receives.
+    """
+
+    def __init__(self, worker_id: int, inbox, outbox):
+        self.worker_id = worker_id
+        self.inbox = inbox
+        self.outbox = outbox
+
+    def receive(self) -> BaseModel:
+        return self.inbox.get()
+
+    def send(self, message: BaseModel) -> None:
+        self.outbox.put(message)
+
+
+class MessageBus:
+    """
+    Process queues between the coordinator and the workers.
+    Workers don't talk to each other, the coordinator routes everything
+    they send to other locations, so a tick is one round trip per worker.
+    """
+
+    def __init__(self, context: BaseContext, worker_count: int):
+        self.coordinator_queue = context.Queue()
+        self.worker_queues = [context.Queue() for _ in range(worker_count)]
+
+    def get_endpoint(self, worker_id: int) -> WorkerEndpoint:
+        return WorkerEndpoint(
+            worker_id, self.worker_queues[worker_id], self.coordinator_queue
+        )
+
+    def send(self, worker_id: int, message: BaseModel) -> None:
+        self.worker_queues[worker_id].put(message)
+
+    def receive(self, timeout: float) -> BaseModel:
+        try:
+            return self.coordinator_queue.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No worker replied in {timeout} seconds")
+
+    def close(self) -> None:
+        for message_queue in [self.coordinator_queue, *self.worker_queues]:
+            message_queue.close()
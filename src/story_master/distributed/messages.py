@@ -0,0 +1,73 @@
+from datetime import datetime
+
+from pydantic import BaseModel
+
+from story_master.entities.event import Event
+from story_master.entities.location import Position
+from story_master.entities.memory import NewMemory
+from story_master.entities.sim import Sim
+
+
+class RegionAssignment(BaseModel):
+    """
+    Worker that owns every location. Locations created during a run,
+    that the assignment doesn't know yet, are spread by their id.
+    """
+
+    worker_count: int
+    owners: dict[int, int] = {}
+
+    def get_owner(self, location_id: int | None) -> int:
+        if location_id in self.owners:
+            return self.owners[location_id]
+        return (location_id or 0) % self.worker_count
+
+
+class TickCommand(BaseModel):
+    """
+    Starts a tick of a worker. Events and sims, that other workers sent
+    to its locations during the previous tick, are delivered first.
+    """
+
+    tick: int
+    current_time: datetime
+    focus_points: list[Position] = []
+    events: list[Event] = []
+    migrations: list[Sim] = []
+
+
+class TickReport(BaseModel):
+    """
+    Result of a tick of a worker, with the events and sims, that left its locations,
+    and the memories of events spilled from full inboxes.
+    """
+
+    worker_id: int
+    tick: int
+    sim_count: int
+    decisions: int
+    failures: int
+    seconds: float
+    events: list[Event] = []
+    migrations: list[Sim] = []
+    memories: list[NewMemory] = []
+
+
+class StopCommand(BaseModel):
+    """
+    Delivers the events and sims still in flight and stops the worker.
+    """
+
+    events: list[Event] = []
+    migrations: list[Sim] = []
+
+
+class WorkerStopped(BaseModel):
+    worker_id: int
+    sims: list[Sim]
+    memories: list[NewMemory] = []
+
+
+class WorkerFailed(BaseModel):
+    worker_id: int
+    error: str
@@ -0,0 +1,195 @@
+import asyncio
+import time
+from collections.abc import Callable
+
+from langchain_core.language_models.chat_models import BaseChatModel
+
+from story_master.distributed.message_bus import WorkerEndpoint
+from story_master.distributed.messages import (
+    RegionAssignment,
+    StopCommand,
+    TickCommand,
+    TickReport,
+    WorkerFailed,
+    WorkerStopped,
+)
+from story_master.entities.event import Event
+from story_master.entities.handlers.event_handler import EventHandler
+from story_master.entities.handlers.storage_handler import StorageHandler
+from story_master.entities.handlers.summary_handler import SummaryHandler
+from story_master.entities.memory import NewMemory
+from story_master.entities.sim import Sim
+from story_master.log import logger
+from story_master.settings import Settings
+from story_master.sim_agent.lod_scheduler import LodScheduler
+from story_master.sim_agent.tick_runner import SimTickRunner
+
+
+class MemoryForwarder:
+    """
+    Collects the memories spilled by the event handler of a worker.
+    They are sent to the coordinator, which is the only writer of the memory store.
+    """
+
+    def __init__(self):
+        self.memories: list[NewMemory] = []
+
+    def add_memories(self, memories: list[NewMemory]) -> None:
+        self.memories.extend(memories)
+
+    def pop_memories(self) -> list[NewMemory]:
+        memories = self.memories
+        self.memories = []
+        return memories
+
+
+class RegionEventHandler(EventHandler):
+    """
+    Event handler of a worker. Events in locations of other workers are kept aside
+    and sent to their owners through the coordinator.
+    """
+
+    def __init__(
+        self,
+        storage_handler: StorageHandler,
+        memory_forwarder: MemoryForwarder,
+        worker_id: int,
+        assignment: RegionAssignment,
+    ):
+        super().__init__(storage_handler, memory_forwarder)
+        self.worker_id = worker_id
+        self.assignment = assignment
+        self.outgoing: list[Event] = []
+
+    def queue_event(self, event: Event) -> None:
+        if self.assignment.get_owner(event.position.location_id) == self.worker_id:
+            super().queue_event(event)
+        else:
+            self.outgoing.append(event)
+
+    def pop_outgoing(self) -> list[Event]:
+        outgoing = self.outgoing
+        self.outgoing = []
+        return outgoing
+
+
+class RegionWorker:
+    """
+    Simulates the sims in the locations owned by one worker process.
+    The worker keeps its sims in its own character storage and writes only
+    the map shards of its locations.
+    """
+
+    def __init__(
+        self,
+        worker_id: int,
+        settings: Settings,
+        assignment: RegionAssignment,
+        llm_client: BaseChatModel,
+    ):
+        self.worker_id = worker_id
+        self.assignment = assignment
+        self.storage_handler = StorageHandler(settings)
+        self.memory_forwarder = MemoryForwarder()
+        self.event_handler = RegionEventHandler(
+            self.storage_handler, self.memory_forwarder, worker_id, assignment
+        )
+        self.scheduler = None
+        if settings.lod.enabled:
+            self.scheduler = LodScheduler(self.storage_handler, settings.lod)
+        self.tick_runner = SimTickRunner(
+            llm_client,
+            self.storage_handler,
+            self.event_handler,
+            SummaryHandler(llm_client),
+            settings.sim_tick_concurrency,
+            settings.sim_history_token_budget,
+            settings.sim_router_retry_budget,
+            self.scheduler,
+            settings.router_batch,
+            settings.sim_prefetch_context,
+        )
+
+    def _receive(self, events: list[Event], migrations: list[Sim]) -> None:
+        for sim in migrations:
+            self.storage_handler.add_sim(sim)
+        for event in events:
+            self.event_handler.queue_event(event)
+        self.event_handler.flush()
+
+    def _send_away_sims(self) -> list[Sim]:
+        """
+        Removes the sims, that have moved to locations of other workers.
+        """
+        migrations = []
+        npc_characters = self.storage_handler.character_storage.npc_characters
+        for sim in list(npc_characters.values()):
+            owner = self.assignment.get_owner(sim.position.location_id)
+            if owner != self.worker_id:
+                self.storage_handler.remove_sim(sim.id)
+                self.tick_runner.compiled_graphs.pop(sim.id, None)
+                migrations.append(sim)
+        return migrations
+
+    def _save(self) -> None:
+        self.storage_handler.save_map()
+        self.storage_handler.save_characters()
+
+    async def arun_tick(self, command: TickCommand) -> TickReport:
+        start = time.perf_counter()
+        self.storage_handler.game_storage.current_time = command.current_time
+        if self.scheduler is not None:
+            self.scheduler.set_focus_points(command.focus_points)
+        self._receive(command.events, command.migrations)
+        decisions = await self.tick_runner.arun_tick()
+        migrations = self._send_away_sims()
+        self._save()
+        return TickReport(
+            worker_id=self.worker_id,
+            tick=command.tick,
+            sim_count=len(decisions),
+            decisions=sum(action is not None for action in decisions.values()),
+            failures=sum(action is None for action in decisions.values()),
+            seconds=time.perf_counter() - start,
+            events=self.event_handler.pop_outgoing(),
+            migrations=migrations,
+            memories=self.memory_forwarder.pop_memories(),
+        )
+
+    def stop(self, command: StopCommand) -> WorkerStopped:
+        self._receive(command.events, command.migrations)
+        self._save()
+        npc_characters = self.storage_handler.character_storage.npc_characters
+        return WorkerStopped(
+            worker_id=self.worker_id,
+            sims=list(npc_characters.values()),
+            memories=self.memory_forwarder.pop_memories(),
+        )
+
+    async def serve(self, endpoint: WorkerEndpoint) -> None:
+        # One event loop for the whole run, the chat client can keep its connections
+        while True:
+            message = await asyncio.to_thread(endpoint.receive)
+            if isinstance(message, StopCommand):
+                endpoint.send(self.stop(message))
+                return
+            endpoint.send(await self.arun_tick(message))
+
+
+def run_worker(
+    worker_id: int,
+    settings: Settings,
+    assignment: RegionAssignment,
+    client_factory: Callable[[], BaseChatModel],
+    endpoint: WorkerEndpoint,
+) -> None:
+    """
+    Entry point of a worker process. Failures are reported to the coordinator.
+    """
+    try:
+        worker = RegionWorker(worker_id, settings, assignment, client_factory())
+        logger.info(f"Worker {worker_id} started")
+        asyncio.run(worker.serve(endpoint))
+    except Exception as error:
+        logger.exception(f"Worker {worker_id} failed")
+        endpoint.send(WorkerFailed(worker_id=worker_id, error=repr(error)))
@@ -0,0 +1,144 @@
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from story_master.settings import EmbeddingCacheSettings
+
+SQLITE_MAX_PARAMETERS = 500
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings client wrapper, that embeds every text only once.
+    Vectors are keyed by a hash of the model name and the text, kept in an in-memory LRU
+    and in SQLite. A batch is looked up at once and only the misses go to the model.
+    """
+
+    def __init__(
+        self,
+        embeddings_client: Embeddings,
+        model_name: str,
+        database_path: str,
+        memory_entries: int,
+    ):
+        self.embeddings_client = embeddings_client
+        self.model_name = model_name
+        self.memory_entries = memory_entries
+        self.memory_cache: OrderedDict[str, list[float]] = OrderedDict()
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(database_path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self.connection.commit()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _get_key(self, kind: str, text: str) -> str:
+        value = f"{self.model_name}\0{kind}\0{text}"
+        return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vector: list[float]) -> None:
+        self.memory_cache[key] = vector
+        self.memory_cache.move_to_end(key)
+        while len(self.memory_cache) > self.memory_entries:
+            self.memory_cache.popitem(last=False)
+
+    def _lookup(self, keys: list[str]) -> dict[str, list[float]]:
+        found = dict()
+        with self.lock:
+            disk_keys = []
+            for key in keys:
+                if key in self.memory_cache:
+                    self.memory_cache.move_to_end(key)
+                    found[key] = self.memory_cache[key]
+                else:
+                    disk_keys.append(key)
+            self.memory_hits += len(found)
+            for start in range(0, len(disk_keys), SQLITE_MAX_PARAMETERS):
+                batch = disk_keys[start : start + SQLITE_MAX_PARAMETERS]
+                rows = self.connection.execute(
+                    "SELECT key, vector FROM embeddings WHERE key IN "
+                    f"({', '.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype=np.float32).tolist()
+                    self._remember(key, found[key])
+                self.disk_hits += len(rows)
+        return found
+
+    def _store(self, vectors: dict[str, list[float]]) -> None:
+        with self.lock:
+            for key, vector in vectors.items():
+                self._remember(key, vector)
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [
+                    (key, np.asarray(vector, dtype=np.float32).tobytes())
+                    for key, vector in vectors.items()
+                ],
+            )
+            self.connection.commit()
+
+    def _embed(self, kind: str, texts: list[str]) -> list[list[float]]:
+        keys = [self._get_key(kind, text) for text in texts]
+        found = self._lookup(keys)
+        # Repeated texts of one batch are embedded once
+        missing = dict()
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing[key] = text
+        if missing:
+            self.misses += len(missing)
+            if kind == "query":
+                new_vectors = [
+                    self.embeddings_client.embed_query(text)
+                    for text in missing.values()
+                ]
+            else:
+                new_vectors = self.embeddings_client.embed_documents(
+                    list(missing.values())
+                )
+            # Rounded like the stored vectors, so hits and misses return the same values
+            new_vectors = {
+                key: np.asarray(vector, dtype=np.float32).tolist()
+                for key, vector in zip(missing.keys(), new_vectors)
+            }
+            self._store(new_vectors)
+            found.update(new_vectors)
+        return [found[key] for key in keys]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._embed("document", texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed("query", [text])[0]
+
+    def get_stats(self) -> dict[str, int]:
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "memory_entries": len(self.memory_cache),
+        }
+
+
+def get_embedding_cache(
+    embeddings_client: Embeddings,
+    model_name: str,
+    cache_settings: EmbeddingCacheSettings,
+) -> CachedEmbeddings:
+    cache_settings.database_path.parent.mkdir(parents=True, exist_ok=True)
+    return CachedEmbeddings(
+        embeddings_client,
+        model_name,
+        str(cache_settings.database_path),
+        cache_settings.memory_entries,
+    )
@@ -1,29 +1,178 @@
-from story_master.entities.handlers.event_handler import EventHandler
-from story_master.llm_client import get_client, get_embeddings_client
+import time
+from contextlib import contextmanager
+from functools import cached_property, partial
 
+from story_master.log import logger
+from story_master.metrics import metrics
 from story_master.settings import Settings
-from story_master.entities.handlers.storage_handler import StorageHandler
-from story_master.entities.handlers.summary_handler import SummaryHandler
-from story_master.entities.handlers.memory_handler import MemoryHandler
-from story_master.generators.environment_generation.map_creator import MapCreator
 
 
 class Engine:
+    """
+    Subsystems are built on first use, and their modules are imported only then,
+    so inspecting saved state doesn't load the LLM clients, LangGraph or the vector store.
+    The time spent building every subsystem, imports included, is kept in startup_timings.
+    """
+
     def __init__(self):
-        self.settings = Settings()
-        self.client = get_client()
-        embeddings_client = get_embeddings_client()
+        self.startup_timings: dict[str, float] = dict()
+        with self._measure_startup("settings"):
+            self.settings = Settings()
+        metrics.enabled = self.settings.metrics_enabled
+
+    @contextmanager
+    def _measure_startup(self, name: str):
+        start = time.perf_counter()
+        yield
+        self.startup_timings[name] = time.perf_counter() - start
+        logger.info(f"Started {name} in {self.startup_timings[name]:.3f} seconds")
+
+    def get_startup_report(self) -> str:
+        lines = [
+            f"{name}: {seconds:.3f} s"
+            for name, seconds in sorted(
+                self.startup_timings.items(), key=lambda item: -item[1]
+            )
+        ]
+        lines.append(f"total: {sum(self.startup_timings.values()):.3f} s")
+        return "\n".join(lines)
+
+    @cached_property
+    def client(self):
+        with self._measure_startup("client"):
+            from story_master.llm_client import get_client
+
+            return get_client(self.settings)
+
+    @cached_property
+    def embeddings_client(self):
+        with self._measure_startup("embeddings_client"):
+            from story_master.llm_client import get_embeddings_client
+
+            return get_embeddings_client(self.settings)
+
+    @cached_property
+    def storage_handler(self):
+        with self._measure_startup("storage_handler"):
+            from story_master.entities.handlers.storage_handler import StorageHandler
+
+            return StorageHandler(self.settings)
+
+    @cached_property
+    def summary_handler(self):
+        client = self.client
+        with self._measure_startup("summary_handler"):
+            from story_master.entities.handlers.summary_handler import SummaryHandler
+
+            return SummaryHandler(client)
+
+    @cached_property
+    def memory_handler(self):
+        embeddings_client = self.embeddings_client
+        storage_handler = self.storage_handler
+        with self._measure_startup("memory_handler"):
+            from story_master.entities.handlers.memory_handler import MemoryHandler
+
+            return MemoryHandler(
+                embeddings_client, self.settings.storage, storage_handler
+            )
+
+    @cached_property
+    def event_handler(self):
+        storage_handler = self.storage_handler
+        memory_handler = self.memory_handler
+        with self._measure_startup("event_handler"):
+            from story_master.entities.handlers.event_handler import EventHandler
+
+            return EventHandler(storage_handler, memory_handler)
+
+    @cached_property
+    def movement_handler(self):
+        storage_handler = self.storage_handler
+        with self._measure_startup("movement_handler"):
+            from story_master.entities.handlers.movement_handler import (
+                MovementHandler,
+            )
+
+            return MovementHandler(
+                storage_handler, self.settings.movement_distance_field_cache_size
+            )
+
+    @cached_property
+    def map_creator(self):
+        client = self.client
+        storage_handler = self.storage_handler
+        summary_handler = self.summary_handler
+        with self._measure_startup("map_creator"):
+            from story_master.generators.environment_generation.map_creator import (
+                MapCreator,
+            )
+
+            return MapCreator(
+                client,
+                storage_handler,
+                summary_handler,
+                self.settings.map_generation_workers,
+            )
+
+    @cached_property
+    def tick_runner(self):
+        client = self.client
+        storage_handler = self.storage_handler
+        event_handler = self.event_handler
+        summary_handler = self.summary_handler
+        with self._measure_startup("tick_runner"):
+            from story_master.sim_agent.lod_scheduler import LodScheduler
+            from story_master.sim_agent.tick_runner import SimTickRunner
+
+            scheduler = None
+            if self.settings.lod.enabled:
+                scheduler = LodScheduler(storage_handler, self.settings.lod)
+            return SimTickRunner(
+                client,
+                storage_handler,
+                event_handler,
+                summary_handler,
+                self.settings.sim_tick_concurrency,
+                self.settings.sim_history_token_budget,
+                self.settings.sim_router_retry_budget,
+                scheduler,
+                self.settings.router_batch,
+                self.settings.sim_prefetch_context,
+            )
+
+    @cached_property
+    def coordinator(self):
+        storage_handler = self.storage_handler
+        memory_handler = self.memory_handler
+        with self._measure_startup("coordinator"):
+            from story_master.distributed.coordinator import SimulationCoordinator
+            from story_master.llm_client import get_client
+
+            # Every worker process creates its own client
+            return SimulationCoordinator(
+                self.settings,
+                storage_handler,
+                partial(get_client, self.settings),
+                memory_handler,
+            )
 
-        self.storage_handler = StorageHandler(self.settings)
-        self.summary_handler = SummaryHandler(self.client)
-        self.memory_handler = MemoryHandler(
-            embeddings_client, self.settings.storage, self.storage_handler
-        )
-        self.event_handler = EventHandler(self.storage_handler)
+    def shutdown(self):
+        # Only subsystems, that were started, need to be closed
+        if "coordinator" in self.__dict__:
+            self.coordinator.stop()
+        if "memory_handler" in self.__dict__:
+            self.memory_handler.close()
+        if metrics.enabled:
+            self.save_metrics()
 
-        self.map_creator = MapCreator(
-            self.client, self.storage_handler, self.summary_handler
-        )
+    def save_metrics(self):
+        path = self.settings.metrics_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.suffix == ".prom":
+            path.write_text(metrics.to_prometheus(), encoding="utf-8")
+        else:
+            path.write_text(metrics.to_json(), encoding="utf-8")
 
     def run(self):
         # self.storage_handler.map.locations = dict()
@@ -39,8 +188,5 @@ class Engine:
 
         # for i in range(2):
         #     logger.info(f"Itteration {i}")
-        #     for sim_id in self.storage_handler.character_storage.npc_characters.keys():
-        #         logger.info(f"Processing sim {sim_id}")
-        #         self.sim_ai_handler.handle(sim_id)
-        #         print("\n" * 5)
+        #     self.tick_runner.run_tick()
         pass
@@ -39,3 +39,53 @@ class Event(BaseModel):
     source: SimReference | ObjectReference | None = None
     target: SimReference | ObjectReference | None = None
     timestamp: datetime.datetime
+
+
+DEFAULT_INBOX_CAPACITY = 32
+
+
+class EventInbox(BaseModel):
+    """
+    Ring buffer of the latest events received by a sim.
+    Events are numbered in the order they arrive, the event number n is stored at
+    n % capacity. The read cursor is the number of the first event, that the sim
+    hasn't consumed yet.
+    """
+
+    capacity: int = DEFAULT_INBOX_CAPACITY
+    events: list[Event] = []
+    next_number: int = 0
+    read_cursor: int = 0
+
+    def push(self, event: Event) -> Event | None:
+        """
+        Adds the event and returns the unread event it has overwritten, if any.
+        """
+        overwritten_event = None
+        if len(self.events) < self.capacity:
+            self.events.append(event)
+        else:
+            index = self.next_number % self.capacity
+            if self.next_number - self.capacity >= self.read_cursor:
+                overwritten_event = self.events[index]
+            self.events[index] = event
+        self.next_number += 1
+        self.read_cursor = max(self.read_cursor, self.next_number - self.capacity)
+        return overwritten_event
+
+    def get_unread(self) -> list[Event]:
+        return [
+            self.events[number % self.capacity]
+            for number in range(self.read_cursor, self.next_number)
+        ]
+
+    def mark_read(self, number: int) -> None:
+        """
+        Moves the read cursor past the events numbered below the given number.
+        """
+        self.read_cursor = max(self.read_cursor, number)
+
+    def consume(self) -> list[Event]:
+        unread_events = self.get_unread()
+        self.mark_read(self.next_number)
+        return unread_events
@@ -1,5 +1,10 @@
-from story_master.entities.event import Event, SimReference
+from collections import defaultdict
+
+from story_master.entities.event import Event, EventType, SimReference
+from story_master.entities.handlers.memory_handler import MemoryHandler
 from story_master.entities.handlers.storage_handler import StorageHandler
+from story_master.entities.memory import MemoryTag, NewMemory
+from story_master.entities.sim import Sim
 from story_master.log import logger
 
 
@@ -7,19 +12,105 @@ class EventHandler:
     def __init__(
         self,
         storage_handler: StorageHandler,
+        memory_handler: MemoryHandler | None = None,
     ):
         self.storage_handler = storage_handler
+        self.memory_handler = memory_handler
+        self.queue: list[Event] = []
 
-    def broadcast_event(self, event: Event) -> None:
-        logger.info(f"Broadcasting event: {event}")
+    @staticmethod
+    def _create_memory(sim: Sim, overwritten_event: Event) -> NewMemory:
+        related_entity_id = None
+        if isinstance(overwritten_event.source, SimReference):
+            related_entity_id = overwritten_event.source.sim_id
+        return NewMemory(
+            memory_owner_id=sim.id,
+            content=f"{overwritten_event.type}: {overwritten_event.description}",
+            tag=MemoryTag.EVENT,
+            related_entity_id=related_entity_id,
+            position=overwritten_event.position,
+        )
+
+    def _spill(self, memories: list[NewMemory]) -> None:
+        """
+        Unread events pushed out of a full inbox are kept as memories.
+        """
+        if not memories:
+            return
+        if self.memory_handler is None:
+            logger.warning(f"Dropping {len(memories)} unread events of full inboxes")
+            return
+        self.memory_handler.add_memories(memories)
+
+    def _get_receivers(self, event: Event) -> list[Sim]:
         if event.radius > 0:
-            receivers = []
-            for sim in self.storage_handler.character_storage.npc_characters.values():
-                if event.position.is_close(sim.position, event.radius):
-                    receivers.append(sim)
-            for sim in receivers:
-                sim.events.append(event)
-        else:
-            if isinstance(event.source, SimReference):
-                sim = self.storage_handler.get_sim(event.source.sim_id)
-                sim.events.append(event)
+            return self.storage_handler.get_sims(event.position, event.radius)
+        if isinstance(event.source, SimReference):
+            sim = self.storage_handler.get_sim(event.source.sim_id)
+            if sim is not None:
+                return [sim]
+        return []
+
+    def queue_event(self, event: Event) -> None:
+        """
+        Collects the event until the next flush.
+        """
+        self.queue.append(event)
+
+    def flush(self) -> None:
+        """
+        Delivers all queued events at once.
+        Identical observations are delivered once. Events are grouped by location and
+        receivers are resolved once per area. Every receiver gets its events
+        in the queue order and is marked dirty once, and overflowing events
+        of all inboxes are spilled in one batch.
+        """
+        if not self.queue:
+            return
+        events = []
+        seen_observations = set()
+        for event in self.queue:
+            if event.type == EventType.OBSERVATION:
+                key = event.model_dump_json()
+                if key in seen_observations:
+                    continue
+                seen_observations.add(key)
+            events.append(event)
+        duplicates = len(self.queue) - len(events)
+        self.queue = []
+
+        events_by_location: dict[int | None, list[Event]] = defaultdict(list)
+        for event in events:
+            events_by_location[event.position.location_id].append(event)
+
+        receivers: dict[int, Sim] = dict()
+        deliveries: dict[int, list[Event]] = defaultdict(list)
+        for location_events in events_by_location.values():
+            # Events from the same place and range, like a conversation, share receivers
+            receivers_by_area: dict[tuple, list[Sim]] = dict()
+            for event in location_events:
+                area = (event.position.x, event.position.y, event.radius)
+                if event.radius <= 0 or area not in receivers_by_area:
+                    receivers_by_area[area] = self._get_receivers(event)
+                for sim in receivers_by_area[area]:
+                    receivers[sim.id] = sim
+                    deliveries[sim.id].append(event)
+
+        memories = []
+        for sim_id, sim_events in deliveries.items():
+            sim = receivers[sim_id]
+            for event in sim_events:
+                overwritten_event = sim.inbox.push(event)
+                if overwritten_event is not None:
+                    memories.append(self._create_memory(sim, overwritten_event))
+            self.storage_handler.mark_sim_dirty(sim_id)
+        self._spill(memories)
+        logger.info(
+            f"Delivered {len(events)} events to {len(deliveries)} sims, "
+            f"skipped {duplicates} duplicate observations"
+        )
+
+    def broadcast_event(self, event: Event) -> None:
+        logger.debug(f"Broadcasting event: {event}")
+        self.queue_event(event)
+        self.flush()
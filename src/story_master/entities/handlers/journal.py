@@ -0,0 +1,71 @@
+import json
+import os
+from pathlib import Path
+
+from story_master.log import logger
+
+
+def write_atomic(path: Path, data: str | bytes) -> None:
+    """
+    Writes the file through a temporary file and a rename,
+    so a crash leaves either the old or the new version on disk.
+    """
+    temp_path = path.with_name(path.name + ".tmp")
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    with open(temp_path, "wb") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+
+
+class Journal:
+    """
+    Append-only file of JSON records, one per line.
+    Every append is fsynced. A partially written last line is ignored on read.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._repair()
+        self.record_count = len(self.read())
+
+    def _repair(self) -> None:
+        # Cut a partial line left by a crash, so new records start on a fresh line
+        if not self.path.exists():
+            return
+        data = self.path.read_bytes()
+        if not data or data.endswith(b"\n"):
+            return
+        logger.error(f"Truncating a partially written record in {self.path}")
+        with open(self.path, "r+b") as file:
+            file.truncate(data.rfind(b"\n") + 1)
+
+    def append(self, records: list[dict]) -> None:
+        if not records:
+            return
+        lines = "".join(json.dumps(record) + "\n" for record in records)
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(lines)
+            file.flush()
+            os.fsync(file.fileno())
+        self.record_count += len(records)
+
+    def read(self) -> list[dict]:
+        if not self.path.exists():
+            return []
+        records = []
+        with open(self.path, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    logger.error(f"Skipping a broken record in {self.path}")
+                    break
+        return records
+
+    def clear(self) -> None:
+        if self.path.exists():
+            self.path.unlink()
+        self.record_count = 0
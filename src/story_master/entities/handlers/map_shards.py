@@ -0,0 +1,227 @@
+from collections import OrderedDict
+from collections.abc import Iterator, MutableMapping
+from pathlib import Path
+
+from pydantic import TypeAdapter
+
+from story_master.entities.handlers.journal import Journal
+from story_master.entities.handlers.snapshot import (
+    SNAPSHOT_SUFFIX,
+    LocationSnapshotCodec,
+)
+from story_master.entities.location import ANY_LOCATION, Object, Region
+from story_master.log import logger
+from story_master.settings import SnapshotSettings
+
+LOCATION_ADAPTER = TypeAdapter(ANY_LOCATION)
+
+
+def replay_location_records(location: ANY_LOCATION, records: list[dict]) -> None:
+    for record in records:
+        match record["type"]:
+            case "object":
+                obj = Object(**record["object"])
+                location.objects[obj.id] = obj
+            case "object_removed":
+                location.objects.pop(record["object_id"], None)
+
+
+def get_object_records(region: Region) -> list[dict]:
+    records = []
+    for object_id in sorted(region.pop_dirty_object_ids()):
+        if object_id in region.objects:
+            obj = region.objects[object_id]
+            records.append({"type": "object", "object": obj.model_dump(mode="json")})
+        else:
+            records.append({"type": "object_removed", "object_id": object_id})
+    return records
+
+
+class MapShardStore:
+    """
+    Stores every location in its own shard: a snapshot and a journal of object changes.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        compaction_records: int,
+        snapshot_settings: SnapshotSettings,
+    ):
+        self.directory = directory
+        self.compaction_records = compaction_records
+        self.codec = LocationSnapshotCodec(snapshot_settings)
+        self.journals: dict[int, Journal] = dict()
+        directory.mkdir(parents=True, exist_ok=True)
+
+    def _get_json_path(self, location_id: int) -> Path:
+        # The codec stores the binary snapshot next to it, with another suffix
+        return self.directory / f"{location_id}.json"
+
+    def _get_journal(self, location_id: int) -> Journal:
+        if location_id not in self.journals:
+            path = self.directory / f"{location_id}.journal.jsonl"
+            self.journals[location_id] = Journal(path)
+        return self.journals[location_id]
+
+    def list_location_ids(self) -> list[int]:
+        paths = [
+            *self.directory.glob("*.json"),
+            *self.directory.glob(f"*{SNAPSHOT_SUFFIX}"),
+        ]
+        location_ids = set()
+        for path in paths:
+            if not path.stem.isdigit():
+                logger.warning(f"Skipping {path.name}, it isn't a location shard")
+                continue
+            location_ids.add(int(path.stem))
+        return sorted(location_ids)
+
+    def load(self, location_id: int) -> ANY_LOCATION:
+        location = self.codec.read(self._get_json_path(location_id))
+        replay_location_records(location, self._get_journal(location_id).read())
+        return location
+
+    def write(self, location: ANY_LOCATION) -> None:
+        self.codec.write(self._get_json_path(location.id), location)
+        self._get_journal(location.id).clear()
+
+    def append(self, location: ANY_LOCATION, records: list[dict]) -> None:
+        journal = self._get_journal(location.id)
+        journal.append(records)
+        if journal.record_count >= self.compaction_records:
+            self.write(location)
+
+    def remove(self, location_id: int) -> None:
+        self._get_journal(location_id).clear()
+        self.codec.remove(self._get_json_path(location_id))
+
+
+class LocationShards(MutableMapping[int, ANY_LOCATION]):
+    """
+    Dict-like view over all locations, that loads shards on first access.
+    When the loaded regions hold more objects than the memory budget,
+    the least recently used ones are dropped from memory on save.
+    Loads never evict, callers can hold a location until the next save.
+    Changes of region objects are journaled. A location, whose other fields changed
+    since it was read or written, or that was marked dirty, is rewritten as a whole.
+    Building objects aren't tracked one by one, so they count as location fields.
+    """
+
+    def __init__(self, store: MapShardStore, memory_budget_objects: int):
+        self.store = store
+        self.memory_budget_objects = memory_budget_objects
+        self.location_ids = set(store.list_location_ids())
+        self.loaded: OrderedDict[int, ANY_LOCATION] = OrderedDict()
+        self.new_location_ids: set[int] = set()
+        self.removed_location_ids: set[int] = set()
+        self.dirty_location_ids: set[int] = set()
+        # Location fields as they are in the shard, to find changes on save
+        self.saved_states: dict[int, dict] = dict()
+
+    @staticmethod
+    def _get_state(location: ANY_LOCATION) -> dict:
+        if isinstance(location, Region):
+            return location.model_dump(exclude={"objects"})
+        return location.model_dump()
+
+    def mark_dirty(self, location_id: int) -> None:
+        self.dirty_location_ids.add(location_id)
+
+    def __getitem__(self, location_id: int) -> ANY_LOCATION:
+        if location_id in self.loaded:
+            self.loaded.move_to_end(location_id)
+            return self.loaded[location_id]
+        if location_id not in self.location_ids:
+            raise KeyError(location_id)
+        location = self.store.load(location_id)
+        self.loaded[location_id] = location
+        self.saved_states[location_id] = self._get_state(location)
+        return location
+
+    def __setitem__(self, location_id: int, location: ANY_LOCATION) -> None:
+        self.location_ids.add(location_id)
+        self.loaded[location_id] = location
+        self.loaded.move_to_end(location_id)
+        self.new_location_ids.add(location_id)
+        self.removed_location_ids.discard(location_id)
+
+    def __delitem__(self, location_id: int) -> None:
+        if location_id not in self.location_ids:
+            raise KeyError(location_id)
+        self.location_ids.discard(location_id)
+        self.loaded.pop(location_id, None)
+        self.new_location_ids.discard(location_id)
+        self.dirty_location_ids.discard(location_id)
+        self.saved_states.pop(location_id, None)
+        self.removed_location_ids.add(location_id)
+
+    def __contains__(self, location_id: object) -> bool:
+        return location_id in self.location_ids
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(sorted(self.location_ids))
+
+    def __len__(self) -> int:
+        return len(self.location_ids)
+
+    def save_location(self, location_id: int) -> None:
+        location = self.loaded[location_id]
+        state = self._get_state(location)
+        if (
+            location_id in self.new_location_ids
+            or location_id in self.dirty_location_ids
+            or state != self.saved_states.get(location_id)
+        ):
+            if isinstance(location, Region):
+                location.pop_dirty_object_ids()
+            self.store.write(location)
+            self.new_location_ids.discard(location_id)
+            self.dirty_location_ids.discard(location_id)
+            self.saved_states[location_id] = state
+        elif isinstance(location, Region):
+            self.store.append(location, get_object_records(location))
+
+    def save(self) -> None:
+        for location_id in self.removed_location_ids:
+            self.store.remove(location_id)
+        self.removed_location_ids = set()
+        for location_id in self.loaded:
+            self.save_location(location_id)
+        self.evict()
+
+    def unload(self) -> None:
+        """
+        Drops the loaded locations without saving them, so they are read from
+        their shards again, after another process has written them.
+        Changes, that weren't saved before, are lost.
+        """
+        self.loaded.clear()
+        self.new_location_ids = set()
+        self.dirty_location_ids = set()
+        self.saved_states = dict()
+
+    def evict(self) -> None:
+        loaded_objects = sum(len(location.objects) for location in self.loaded.values())
+        while loaded_objects > self.memory_budget_objects and len(self.loaded) > 1:
+            location_id = next(iter(self.loaded))
+            self.save_location(location_id)
+            location = self.loaded.pop(location_id)
+            self.saved_states.pop(location_id, None)
+            loaded_objects -= len(location.objects)
+            logger.info(f"Evicted location {location_id} from memory")
+
+
+class ShardedMap:
+    def __init__(
+        self,
+        directory: Path,
+        compaction_records: int,
+        memory_budget_objects: int,
+        snapshot_settings: SnapshotSettings,
+    ):
+        self.store = MapShardStore(directory, compaction_records, snapshot_settings)
+        self.locations = LocationShards(self.store, memory_budget_objects)
+
+    def save(self) -> None:
+        self.locations.save()
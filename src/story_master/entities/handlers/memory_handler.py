@@ -1,10 +1,20 @@
+import threading
+import time
+
+import numpy as np
 from langchain_core.embeddings import Embeddings
-from langchain_chroma import Chroma
 from story_master.settings import StorageSettings
-from story_master.entities.memory import MemoryTag
+from story_master.entities.handlers.memory_stores import create_memory_store
+from story_master.entities.memory import MemoryTag, NewMemory, ScoredMemory
 from story_master.entities.handlers.storage_handler import StorageHandler
 from story_master.entities.location import Position
+from story_master.log import logger
 import datetime
+from story_master.metrics import timed
+
+# Game dates are shifted before converting to unix timestamps
+TIMESTAMP_OFFSET = datetime.timedelta(days=365 * 600)
+RECENCY_DECAY_PER_HOUR = 0.995
 
 
 class MemoryHandler:
@@ -14,13 +24,40 @@ class MemoryHandler:
         storage_settings: StorageSettings,
         storage_handler: StorageHandler,
     ):
-        self.memory_store = Chroma(
-            collection_name=storage_settings.memory_collection,
-            embedding_function=embeddings_client,
-            persist_directory=str(storage_settings.data_file_path),
-        )
+        self.memory_store = create_memory_store(embeddings_client, storage_settings)
         self.storage_handler = storage_handler
 
+        self.buffer_size = storage_settings.memory_buffer_size
+        self.flush_interval = storage_settings.memory_flush_interval
+        self.buffer: list[tuple[str, dict]] = []
+        self.buffer_lock = threading.Lock()
+        self.last_flush_time = time.monotonic()
+
+        self.retrieval_candidates = storage_settings.memory_retrieval_candidates
+        self.score_weights = np.array(
+            [
+                storage_settings.memory_relevance_weight,
+                storage_settings.memory_recency_weight,
+                storage_settings.memory_importance_weight,
+            ],
+            dtype=np.float32,
+        )
+
+    def _get_current_timestamp(self) -> float:
+        current_time = self.storage_handler.game_storage.current_time
+        return (current_time + TIMESTAMP_OFFSET).timestamp()
+
+    def _create_metadata(self, memory: NewMemory) -> dict:
+        position_json = memory.position.model_dump_json() if memory.position else ""
+        return {
+            "memory_owner_id": memory.memory_owner_id,
+            "tag": memory.tag,
+            "importance": memory.importance,
+            "related_entity_id": memory.related_entity_id,
+            "position": position_json,
+            "timestamp": self._get_current_timestamp(),
+        }
+
     def add_memory(
         self,
         memory_owner_id: int,
@@ -30,18 +67,123 @@ class MemoryHandler:
         related_entity_id: int | None = None,
         position: Position | None = None,
     ) -> None:
-        position_json = position.model_dump_json() if position else ""
-        current_datetime = (
-            self.storage_handler.game_storage.current_time
-            + datetime.timedelta(days=365 * 600)
+        memory = NewMemory(
+            memory_owner_id=memory_owner_id,
+            content=content,
+            tag=tag,
+            importance=importance,
+            related_entity_id=related_entity_id,
+            position=position,
         )
+        self.add_memories([memory])
 
-        metadata = {
-            "memory_owner_id": memory_owner_id,
-            "tag": tag,
-            "importance": importance,
-            "related_entity_id": related_entity_id,
-            "position": position_json,
-            "timestamp": current_datetime.timestamp(),
-        }
-        self.memory_store.add_texts([content], metadatas=[metadata])
+    @timed("memory.add_memories")
+    def add_memories(self, memories: list[NewMemory]) -> None:
+        """
+        Adds memories with a single batched embeddings call and collection write.
+        If the write-behind buffer is enabled, the memories are only queued
+        until the buffer is full or the flush interval has passed.
+        """
+        records = [
+            (memory.content, self._create_metadata(memory)) for memory in memories
+        ]
+        if self.buffer_size <= 0:
+            self._write(records)
+            return
+
+        with self.buffer_lock:
+            self.buffer.extend(records)
+        self.flush_if_due()
+
+    def flush_if_due(self) -> None:
+        """
+        Writes the buffer when it is full or the flush interval has passed.
+        Called after every add and at the end of every tick.
+        """
+        flush_time = self.last_flush_time + self.flush_interval
+        if len(self.buffer) >= self.buffer_size or time.monotonic() >= flush_time:
+            self.flush()
+
+    def flush(self) -> None:
+        with self.buffer_lock:
+            records = self.buffer
+            self.buffer = []
+            self.last_flush_time = time.monotonic()
+        self._write(records)
+
+    @timed("memory.write")
+    def _write(self, records: list[tuple[str, dict]]) -> None:
+        if not records:
+            return
+        texts = [content for content, _ in records]
+        metadatas = [metadata for _, metadata in records]
+        logger.info(f"Writing {len(texts)} memories")
+        self.memory_store.add(texts, metadatas)
+
+    @timed("memory.retrieve")
+    def retrieve(
+        self,
+        memory_owner_id: int,
+        query: str,
+        k: int = 5,
+        tag: MemoryTag | None = None,
+    ) -> list[ScoredMemory]:
+        """
+        Returns the k best memories of the owner for the query.
+        The vector store prefilters by owner and tag and returns the most relevant candidates.
+        Candidates are ranked by a weighted sum of relevance, recency and importance.
+        """
+        if self.buffer:
+            self.flush()
+        candidates = self.memory_store.search(
+            query, max(k, self.retrieval_candidates), memory_owner_id, tag
+        )
+        if not candidates:
+            return []
+
+        # Distances are min-max normalized into relevance between 0 and 1
+        distances = np.array(
+            [distance for _, _, distance in candidates], dtype=np.float32
+        )
+        distance_range = distances.max() - distances.min()
+        if distance_range > 0:
+            relevance = 1 - (distances - distances.min()) / distance_range
+        else:
+            relevance = np.ones_like(distances)
+        timestamps = np.array(
+            [metadata["timestamp"] for _, metadata, _ in candidates],
+            dtype=np.float64,
+        )
+        importance = np.array(
+            [metadata["importance"] for _, metadata, _ in candidates],
+            dtype=np.float32,
+        )
+        hours_passed = np.maximum(self._get_current_timestamp() - timestamps, 0) / 3600
+        recency = np.power(RECENCY_DECAY_PER_HOUR, hours_passed).astype(np.float32)
+        features = np.stack([relevance, recency, importance / 10], axis=1)
+        scores = features @ self.score_weights
+
+        top_indexes = np.argsort(-scores, kind="stable")[:k]
+        memories = []
+        for index in top_indexes:
+            content, metadata, _ = candidates[index]
+            position = metadata.get("position")
+            related_entity_id = metadata.get("related_entity_id")
+            memories.append(
+                ScoredMemory(
+                    content=content,
+                    timestamp=datetime.datetime.fromtimestamp(metadata["timestamp"])
+                    - TIMESTAMP_OFFSET,
+                    tag=metadata.get("tag"),
+                    importance=metadata["importance"],
+                    related_entity_id=related_entity_id,
+                    position=Position.model_validate_json(position)
+                    if position
+                    else None,
+                    score=float(scores[index]),
+                )
+            )
+        return memories
+
+    def close(self) -> None:
+        self.flush()
@@ -0,0 +1,292 @@
+import json
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from story_master.entities.handlers.journal import Journal, write_atomic
+from story_master.entities.memory import MemoryTag
+from story_master.log import logger
+from story_master.settings import StorageSettings
+
+# content, metadata, distance - smaller distances are more relevant
+MemoryCandidate = tuple[str, dict, float]
+
+MEMORY_TAGS = list(MemoryTag)
+INITIAL_CAPACITY = 1024
+KMEANS_ITERATIONS = 8
+NO_ENTITY = -1
+
+
+class BaseMemoryStore(ABC):
+    @abstractmethod
+    def add(self, texts: list[str], metadatas: list[dict]) -> None:
+        pass
+
+    @abstractmethod
+    def search(
+        self, query: str, k: int, memory_owner_id: int, tag: MemoryTag | None
+    ) -> list[MemoryCandidate]:
+        pass
+
+
+class ChromaMemoryStore(BaseMemoryStore):
+    def __init__(
+        self, embeddings_client: Embeddings, storage_settings: StorageSettings
+    ):
+        # Imported here, chromadb is only needed when this backend is selected
+        from langchain_chroma import Chroma
+
+        self.collection = Chroma(
+            collection_name=storage_settings.memory_collection,
+            embedding_function=embeddings_client,
+            persist_directory=str(storage_settings.data_file_path),
+        )
+
+    def add(self, texts: list[str], metadatas: list[dict]) -> None:
+        # The vector store doesn't accept None values
+        metadatas = [
+            {key: value for key, value in metadata.items() if value is not None}
+            for metadata in metadatas
+        ]
+        self.collection.add_texts(texts, metadatas=metadatas)
+
+    def search(
+        self, query: str, k: int, memory_owner_id: int, tag: MemoryTag | None
+    ) -> list[MemoryCandidate]:
+        conditions = [{"memory_owner_id": memory_owner_id}]
+        if tag is not None:
+            conditions.append({"tag": tag})
+        where = conditions[0] if len(conditions) == 1 else {"$and": conditions}
+        results = self.collection.similarity_search_with_score(query, k=k, filter=where)
+        return [
+            (document.page_content, document.metadata, distance)
+            for document, distance in results
+        ]
+
+
+class NumpyMemoryStore(BaseMemoryStore):
+    """
+    In-process store. Unit length float32 embeddings and the numeric metadata columns
+    live in memory-mapped files, texts and positions in an append-only journal.
+    The header with the row count is written last, so rows of an interrupted
+    write are ignored on load.
+    Search is brute force over the rows of the owner. Above approximate_threshold rows
+    an inverted file index is used: rows are clustered around centroids and only the
+    clusters closest to the query are scanned.
+    """
+
+    COLUMNS = {
+        "memory_owner_id": np.int64,
+        "timestamp": np.float64,
+        "importance": np.int32,
+        "tag": np.int16,
+        "related_entity_id": np.int64,
+    }
+
+    def __init__(
+        self, embeddings_client: Embeddings, storage_settings: StorageSettings
+    ):
+        self.embeddings_client = embeddings_client
+        self.path = storage_settings.memory_index_path
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.approximate_threshold = storage_settings.memory_approximate_threshold
+        self.probes = storage_settings.memory_approximate_probes
+        self.lock = threading.Lock()
+
+        self.header_path = self.path / "header.json"
+        self.records_journal = Journal(self.path / "records.jsonl")
+        header = dict()
+        if self.header_path.exists():
+            header = json.loads(self.header_path.read_text(encoding="utf-8"))
+        self.count = header.get("count", 0)
+        self.capacity = header.get("capacity", 0)
+        self.dimension = header.get("dimension")
+
+        self.vectors: np.memmap | None = None
+        self.columns: dict[str, np.memmap] = dict()
+        self.records: list[dict] = []
+        if self.count:
+            self._open(self.capacity)
+            self.records = self.records_journal.read()[: self.count]
+        if self.records_journal.record_count > self.count:
+            # Records of a write, that was interrupted before the header
+            self.records_journal.clear()
+            self.records_journal.append(self.records)
+
+        self.centroids: np.ndarray | None = None
+        self.assignments: np.ndarray | None = None
+        self.indexed_count = 0
+
+    def _get_file(self, name: str) -> Path:
+        return self.path / f"{name}.bin"
+
+    def _open_array(self, name: str, dtype, shape: tuple) -> np.memmap:
+        path = self._get_file(name)
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        # Growing the file keeps the existing rows, new bytes are zeros
+        with open(path, "ab") as file:
+            if file.tell() < size:
+                file.truncate(size)
+        return np.memmap(path, dtype=dtype, mode="r+", shape=shape)
+
+    def _open(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.vectors = self._open_array(
+            "vectors", np.float32, (capacity, self.dimension)
+        )
+        self.columns = {
+            name: self._open_array(name, dtype, (capacity,))
+            for name, dtype in self.COLUMNS.items()
+        }
+
+    def _ensure_capacity(self, count: int) -> None:
+        if count <= self.capacity:
+            return
+        capacity = max(self.capacity, INITIAL_CAPACITY)
+        while capacity < count:
+            capacity *= 2
+        self._open(capacity)
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def add(self, texts: list[str], metadatas: list[dict]) -> None:
+        if not texts:
+            return
+        vectors = np.array(
+            self.embeddings_client.embed_documents(texts), dtype=np.float32
+        )
+        vectors = self._normalize(vectors)
+        with self.lock:
+            if self.dimension is None:
+                self.dimension = vectors.shape[1]
+            start = self.count
+            end = start + len(texts)
+            self._ensure_capacity(end)
+
+            self.vectors[start:end] = vectors
+            for name in self.COLUMNS:
+                values = [metadata.get(name) for metadata in metadatas]
+                if name == "tag":
+                    values = [
+                        MEMORY_TAGS.index(tag) + 1 if tag else 0 for tag in values
+                    ]
+                elif name == "related_entity_id":
+                    values = [NO_ENTITY if value is None else value for value in values]
+                self.columns[name][start:end] = values
+            self.vectors.flush()
+            for column in self.columns.values():
+                column.flush()
+
+            records = [
+                {"content": text, "position": metadata.get("position") or ""}
+                for text, metadata in zip(texts, metadatas)
+            ]
+            self.records_journal.append(records)
+            self.records.extend(records)
+            self.count = end
+            header = {
+                "count": self.count,
+                "capacity": self.capacity,
+                "dimension": self.dimension,
+            }
+            write_atomic(self.header_path, json.dumps(header))
+
+    def _build_index(self) -> None:
+        # A few k-means iterations on a sample, sqrt(n) clusters
+        vectors = np.asarray(self.vectors[: self.count])
+        cluster_count = max(int(np.sqrt(self.count)), 1)
+        rng = np.random.default_rng(0)
+        sample_size = min(self.count, cluster_count * 64)
+        sample = vectors[rng.choice(self.count, sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, cluster_count, replace=False)]
+        for _ in range(KMEANS_ITERATIONS):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            for cluster in range(cluster_count):
+                members = sample[labels == cluster]
+                if len(members):
+                    centroids[cluster] = members.mean(axis=0)
+            centroids = self._normalize(centroids)
+        self.centroids = centroids
+        self.assignments = np.argmax(vectors @ centroids.T, axis=1)
+        self.indexed_count = self.count
+        logger.info(f"Built a memory index with {cluster_count} clusters")
+
+    def _update_index(self) -> None:
+        if self.count < self.approximate_threshold:
+            return
+        # Rebuilt when the store has doubled, newer rows join the closest cluster
+        if self.centroids is None or self.count >= 2 * self.indexed_count:
+            self._build_index()
+        elif len(self.assignments) < self.count:
+            new_vectors = np.asarray(self.vectors[len(self.assignments) : self.count])
+            new_assignments = np.argmax(new_vectors @ self.centroids.T, axis=1)
+            self.assignments = np.concatenate([self.assignments, new_assignments])
+
+    def _get_candidate_rows(
+        self, query_vector: np.ndarray, mask: np.ndarray, k: int
+    ) -> np.ndarray:
+        rows = np.flatnonzero(mask)
+        if self.centroids is None or len(rows) < self.approximate_threshold:
+            return rows
+        closest_clusters = np.argsort(-(self.centroids @ query_vector))[: self.probes]
+        probed_rows = rows[np.isin(self.assignments[rows], closest_clusters)]
+        # Too few rows in the probed clusters, scan everything
+        return probed_rows if len(probed_rows) >= k else rows
+
+    def search(
+        self, query: str, k: int, memory_owner_id: int, tag: MemoryTag | None
+    ) -> list[MemoryCandidate]:
+        query_vector = np.array(self.embeddings_client.embed_query(query), np.float32)
+        query_vector = query_vector / max(np.linalg.norm(query_vector), 1e-12)
+        with self.lock:
+            if self.count == 0:
+                return []
+            self._update_index()
+            mask = self.columns["memory_owner_id"][: self.count] == memory_owner_id
+            if tag is not None:
+                mask &= self.columns["tag"][: self.count] == MEMORY_TAGS.index(tag) + 1
+            rows = self._get_candidate_rows(query_vector, mask, k)
+            if len(rows) == 0:
+                return []
+            distances = 1 - self.vectors[rows] @ query_vector
+            best = np.argsort(distances, kind="stable")[:k]
+
+            candidates = []
+            for index in best:
+                row = rows[index]
+                tag_code = int(self.columns["tag"][row])
+                related_entity_id = int(self.columns["related_entity_id"][row])
+                metadata = {
+                    "memory_owner_id": int(self.columns["memory_owner_id"][row]),
+                    "timestamp": float(self.columns["timestamp"][row]),
+                    "importance": int(self.columns["importance"][row]),
+                    "tag": MEMORY_TAGS[tag_code - 1] if tag_code else None,
+                    "related_entity_id": None
+                    if related_entity_id == NO_ENTITY
+                    else related_entity_id,
+                    "position": self.records[row]["position"],
+                }
+                candidates.append(
+                    (self.records[row]["content"], metadata, float(distances[index]))
+                )
+            return candidates
+
+
+def create_memory_store(
+    embeddings_client: Embeddings, storage_settings: StorageSettings
+) -> BaseMemoryStore:
+    match storage_settings.memory_backend:
+        case "numpy":
+            return NumpyMemoryStore(embeddings_client, storage_settings)
+        case "chroma":
+            return ChromaMemoryStore(embeddings_client, storage_settings)
+        case _:
+            raise ValueError(
+                f"Unknown memory backend {storage_settings.memory_backend}"
+            )
@@ -0,0 +1,114 @@
+from collections import OrderedDict
+
+from story_master.entities.handlers.storage_handler import StorageHandler
+from story_master.entities.location import Position, Region
+from story_master.entities.object_index import Footprint
+from story_master.entities.pathfinding import (
+    DistanceField,
+    OccupancyGrid,
+    expand_bounds,
+    find_path,
+    get_adjacent_cells,
+)
+from story_master.log import logger
+from story_master.metrics import timed
+
+# Free cells searched around the start and the goal of a single path
+PATH_SEARCH_MARGIN = 32
+# Cells covered by a cached distance field around its target
+DISTANCE_FIELD_RADIUS = 64
+
+
+class MovementHandler:
+    """
+    Moves sims over the occupancy grid of their region.
+    Paths to a position are found with A*. Paths to an object follow a distance field
+    of that object, which is cached, so repeated trips to the same building or resource
+    cost only the walk itself. A field is dropped when objects of its region change.
+    """
+
+    def __init__(self, storage_handler: StorageHandler, cache_size: int):
+        self.storage_handler = storage_handler
+        self.cache_size = cache_size
+        # (location id, target footprint) -> (region object version, field)
+        self.distance_fields: OrderedDict[
+            tuple[int, Footprint], tuple[int, DistanceField]
+        ] = OrderedDict()
+
+    def _get_region(self, location_id: int) -> Region | None:
+        region = self.storage_handler.get_location(location_id)
+        if not isinstance(region, Region):
+            logger.error(f"Sims can only move inside regions, got {region}")
+            return None
+        return region
+
+    def get_distance_field(self, region: Region, target: Footprint) -> DistanceField:
+        key = (region.id, target)
+        version = region.get_object_version()
+        if key in self.distance_fields:
+            field_version, distance_field = self.distance_fields[key]
+            if field_version == version:
+                self.distance_fields.move_to_end(key)
+                return distance_field
+            del self.distance_fields[key]
+
+        target_cells = get_adjacent_cells(target)
+        grid = OccupancyGrid(region, expand_bounds(target_cells, DISTANCE_FIELD_RADIUS))
+        distance_field = DistanceField(grid, target_cells)
+        self.distance_fields[key] = (version, distance_field)
+        while len(self.distance_fields) > self.cache_size:
+            self.distance_fields.popitem(last=False)
+        return distance_field
+
+    @timed("movement.find_path")
+    def find_path(self, start: Position, goal: Position) -> list[Position] | None:
+        if start.location_id != goal.location_id:
+            logger.error(f"Can't find a path between locations {start} and {goal}")
+            return None
+        region = self._get_region(start.location_id)
+        if region is None:
+            return None
+        cells = [(start.x, start.y), (goal.x, goal.y)]
+        grid = OccupancyGrid(region, expand_bounds(cells, PATH_SEARCH_MARGIN))
+        path = find_path(grid, cells[0], cells[1])
+        if path is None:
+            return None
+        return [Position(location_id=region.id, x=x, y=y) for x, y in path]
+
+    @timed("movement.find_path_to_object")
+    def find_path_to_object(
+        self, start: Position, object_id: int
+    ) -> list[Position] | None:
+        """
+        Finds a path to the closest cell next to the object.
+        """
+        region = self._get_region(start.location_id)
+        if region is None:
+            return None
+        obj = region.objects.get(object_id)
+        if obj is None:
+            logger.error(f"Object {object_id} is not in region {region.id}")
+            return None
+        distance_field = self.get_distance_field(region, obj.get_footprint())
+        path = distance_field.get_path((start.x, start.y))
+        if path is None:
+            # The start is outside of the cached field
+            target_cells = get_adjacent_cells(obj.get_footprint())
+            grid = OccupancyGrid(
+                region,
+                expand_bounds(target_cells + [(start.x, start.y)], PATH_SEARCH_MARGIN),
+            )
+            path = DistanceField(grid, target_cells).get_path((start.x, start.y))
+        if path is None:
+            return None
+        return [Position(location_id=region.id, x=x, y=y) for x, y in path]
+
+    def move_sim(self, sim_id: int, path: list[Position], max_steps: int) -> Position:
+        """
+        Moves the sim along the path by at most max_steps cells and returns its new position.
+        """
+        sim = self.storage_handler.get_sim(sim_id)
+        if path and max_steps > 0:
+            position = path[min(max_steps, len(path)) - 1]
+            self.storage_handler.move_sim(sim_id, position)
+        return sim.position
@@ -0,0 +1,269 @@
+import contextlib
+import functools
+import gc
+import hashlib
+import json
+import struct
+import zlib
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import ormsgpack
+from pydantic import BaseModel, TypeAdapter
+
+from story_master.entities.handlers.journal import write_atomic
+from story_master.entities.location import ANY_LOCATION, Object, Position
+from story_master.settings import SnapshotSettings
+
+MAGIC = b"SMSN"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_SUFFIX = ".snapshot"
+FLAG_COMPRESSED = 1
+# Magic, format version, flags, fingerprint of the schema the data was written with
+HEADER = struct.Struct("<4sHB8s")
+PACK_OPTIONS = ormsgpack.OPT_SERIALIZE_PYDANTIC | ormsgpack.OPT_NON_STR_KEYS
+# Stands for a missing location id or text in the object columns
+NO_LOCATION = np.iinfo(np.int64).min
+NO_TEXT = -1
+
+
+def get_snapshot_path(json_path: Path) -> Path:
+    return json_path.with_suffix(SNAPSHOT_SUFFIX)
+
+
+@functools.cache
+def get_schema_fingerprint(annotation) -> bytes:
+    schema = TypeAdapter(annotation).json_schema()
+    schema_json = json.dumps(schema, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(schema_json).digest()[:8]
+
+
+@contextlib.contextmanager
+def _gc_paused():
+    # Loads create millions of acyclic objects, on which the collector would
+    # repeatedly scan the whole growing heap
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _construct_plain(model_type: type[BaseModel], values: dict) -> BaseModel:
+    """
+    Creates the model from values of all its fields without validating them.
+    The model can't have private attributes.
+    """
+    instance = model_type.__new__(model_type)
+    object.__setattr__(instance, "__dict__", values)
+    object.__setattr__(instance, "__pydantic_fields_set__", set(values))
+    object.__setattr__(instance, "__pydantic_extra__", None)
+    object.__setattr__(instance, "__pydantic_private__", None)
+    return instance
+
+
+class SnapshotCodec:
+    """
+    Reads and writes a value of the annotated type as a versioned binary snapshot:
+    a header followed by the msgpack encoded value, optionally compressed with zlib.
+    Snapshots written with the current schema are trusted, the location codec builds
+    their objects without validation. Files without the snapshot header are read as the json the engine used before.
+    """
+
+    def __init__(self, annotation, settings: SnapshotSettings):
+        self.annotation = annotation
+        self.settings = settings
+        self.adapter = TypeAdapter(annotation)
+
+    def _encode(self, value) -> Any:
+        return value
+
+    def _decode(self, payload: Any, trusted: bool) -> Any:
+        # Building nested models in Python is no faster than validating them
+        return self.adapter.validate_python(payload)
+
+    def dumps(self, value) -> bytes:
+        payload = ormsgpack.packb(self._encode(value), option=PACK_OPTIONS)
+        flags = 0
+        if self.settings.compression:
+            payload = zlib.compress(payload, self.settings.compression_level)
+            flags |= FLAG_COMPRESSED
+        header = HEADER.pack(
+            MAGIC, SNAPSHOT_VERSION, flags, get_schema_fingerprint(self.annotation)
+        )
+        return header + payload
+
+    def loads(self, data: bytes) -> Any:
+        with _gc_paused():
+            return self._loads(data)
+
+    def _loads(self, data: bytes) -> Any:
+        if not data.startswith(MAGIC):
+            return self.adapter.validate_json(data)
+        _, version, flags, fingerprint = HEADER.unpack_from(data)
+        if version > SNAPSHOT_VERSION:
+            raise ValueError(f"Snapshot version {version} is newer than this engine")
+        payload = data[HEADER.size :]
+        if flags & FLAG_COMPRESSED:
+            payload = zlib.decompress(payload)
+        trusted = self.settings.trusted_loads and fingerprint == get_schema_fingerprint(
+            self.annotation
+        )
+        return self._decode(
+            ormsgpack.unpackb(payload, option=ormsgpack.OPT_NON_STR_KEYS), trusted
+        )
+
+    def to_json(self, value) -> str:
+        return self.adapter.dump_json(value, indent=2).decode("utf-8")
+
+    def find(self, json_path: Path) -> Path | None:
+        """
+        Returns the file of the value, the configured format first.
+        """
+        paths = [json_path, get_snapshot_path(json_path)]
+        if self.settings.format == "binary":
+            paths.reverse()
+        for path in paths:
+            if path.exists():
+                return path
+        return None
+
+    def read(self, json_path: Path) -> Any | None:
+        path = self.find(json_path)
+        if path is None:
+            return None
+        return self.loads(path.read_bytes())
+
+    def write(self, json_path: Path, value) -> None:
+        """
+        Writes the value in the configured format and removes the file of the other one.
+        """
+        if self.settings.format == "binary":
+            path, stale_path = get_snapshot_path(json_path), json_path
+            write_atomic(path, self.dumps(value))
+        else:
+            path, stale_path = json_path, get_snapshot_path(json_path)
+            write_atomic(path, self.to_json(value))
+        stale_path.unlink(missing_ok=True)
+
+    def remove(self, json_path: Path) -> None:
+        json_path.unlink(missing_ok=True)
+        get_snapshot_path(json_path).unlink(missing_ok=True)
+
+
+class LocationSnapshotCodec(SnapshotCodec):
+    """
+    Stores the objects of a location in columns: the numbers in one int64 array and
+    the texts as indices into a table of distinct strings, since most objects
+    share their names and descriptions.
+    Objects of trusted snapshots are created straight from the columns.
+    """
+
+    def __init__(self, settings: SnapshotSettings):
+        super().__init__(ANY_LOCATION, settings)
+
+    def _encode(self, location: ANY_LOCATION) -> dict:
+        strings: dict[str, int] = dict()
+        numbers = []
+        texts = []
+        for obj in location.objects.values():
+            position = obj.position
+            location_id = position.location_id
+            numbers.append(
+                (
+                    obj.id,
+                    NO_LOCATION if location_id is None else location_id,
+                    position.x,
+                    position.y,
+                    obj.width,
+                    obj.height,
+                )
+            )
+            texts.append(
+                tuple(
+                    NO_TEXT if text is None else strings.setdefault(text, len(strings))
+                    for text in (obj.name, obj.description, obj.hidden_description)
+                )
+            )
+        return {
+            "location": location.model_dump(exclude={"objects"}),
+            "objects": {
+                "count": len(numbers),
+                "numbers": np.array(numbers, dtype=np.int64).tobytes(),
+                "texts": np.array(texts, dtype=np.int32).tobytes(),
+                "strings": list(strings),
+            },
+        }
+
+    @staticmethod
+    def _get_object_rows(columns: dict) -> list[tuple[list, list]]:
+        count = columns["count"]
+        numbers = np.frombuffer(columns["numbers"], dtype=np.int64).reshape(count, 6)
+        texts = np.frombuffer(columns["texts"], dtype=np.int32).reshape(count, 3)
+        return list(zip(numbers.tolist(), texts.tolist()))
+
+    def _decode(self, payload: dict, trusted: bool) -> ANY_LOCATION:
+        # NO_TEXT indexes the last string
+        strings = payload["objects"]["strings"] + [None]
+        rows = self._get_object_rows(payload["objects"])
+        if not trusted:
+            objects = {
+                object_id: {
+                    "id": object_id,
+                    "name": strings[name],
+                    "description": strings[description],
+                    "hidden_description": strings[hidden_description],
+                    "position": {
+                        "location_id": None
+                        if location_id == NO_LOCATION
+                        else location_id,
+                        "x": x,
+                        "y": y,
+                    },
+                    "width": width,
+                    "height": height,
+                }
+                for (object_id, location_id, x, y, width, height), (
+                    name,
+                    description,
+                    hidden_description,
+                ) in rows
+            }
+            return self.adapter.validate_python(
+                {**payload["location"], "objects": objects}
+            )
+
+        objects = dict()
+        for (object_id, location_id, x, y, width, height), (
+            name,
+            description,
+            hidden_description,
+        ) in rows:
+            position = _construct_plain(
+                Position,
+                {
+                    "location_id": None if location_id == NO_LOCATION else location_id,
+                    "x": x,
+                    "y": y,
+                },
+            )
+            objects[object_id] = _construct_plain(
+                Object,
+                {
+                    "id": object_id,
+                    "name": strings[name],
+                    "description": strings[description],
+                    "hidden_description": strings[hidden_description],
+                    "position": position,
+                    "width": width,
+                    "height": height,
+                },
+            )
+        # Regions and buildings have the same fields, the small location part is
+        # validated to pick the type the same way as a json load
+        location = self.adapter.validate_python(payload["location"])
+        location.objects = objects
+        return location
@@ -1,9 +1,31 @@
+from pathlib import Path
+
 from story_master.settings import Settings
 from pydantic import BaseModel
 import json
 from story_master.entities.sim import Sim
-from story_master.entities.location import Map, Position, Object, ANY_LOCATION
+from story_master.entities.location import (
+    Map,
+    Position,
+    Object,
+    Region,
+    ANY_LOCATION,
+)
+from story_master.entities.spatial_index import SimSpatialIndex
+from story_master.entities.handlers.journal import Journal, write_atomic
+from story_master.entities.handlers.snapshot import SnapshotCodec
+from story_master.entities.handlers.map_shards import (
+    LOCATION_ADAPTER,
+    ShardedMap,
+    replay_location_records,
+)
+from story_master.log import logger
 from datetime import datetime
+from story_master.metrics import timed
+
+
+def get_journal_path(storage_path: Path) -> Path:
+    return storage_path.with_name(storage_path.stem + ".journal.jsonl")
 
 
 class CharacterStorage(BaseModel):
@@ -26,19 +48,21 @@ class StorageHandler:
 
         settings.characters_storage_path.parent.mkdir(parents=True, exist_ok=True)
 
-        if settings.characters_storage_path.exists():
-            self.character_storage = CharacterStorage(
-                **json.loads(
-                    self.settings.characters_storage_path.read_text(encoding="utf-8")
-                )
-            )
-        else:
+        self.characters_codec = SnapshotCodec(CharacterStorage, settings.snapshot)
+        self.character_storage = self.characters_codec.read(
+            settings.characters_storage_path
+        )
+        if self.character_storage is None:
             self.character_storage = CharacterStorage()
 
-        if settings.map_storage_path.exists():
-            self.map = Map(**json.loads(self.settings.map_storage_path.read_text()))
-        else:
-            self.map = Map()
+        self.map = ShardedMap(
+            settings.map_shards_path,
+            settings.journal_compaction_records,
+            settings.map_memory_budget_objects,
+            settings.snapshot,
+        )
+        if len(self.map.locations) == 0 and settings.map_storage_path.exists():
+            self._migrate_legacy_map()
 
         if settings.game_storage_path.exists():
             self.game_storage = GameStorage(
@@ -51,6 +75,52 @@ class StorageHandler:
                 current_time=self.settings.default_starting_time
             )
 
+        # Changes since the last snapshot are appended to journals and replayed on load
+        self.characters_journal = Journal(
+            get_journal_path(settings.characters_storage_path)
+        )
+        self._replay_characters_journal()
+
+        self.saved_sim_ids = set(self.character_storage.npc_characters.keys())
+        self.dirty_sim_ids: set[int] = set()
+        self.saved_game_json = self.game_storage.model_dump_json(indent=2)
+
+        self.sim_index = SimSpatialIndex()
+        for sim in self.character_storage.npc_characters.values():
+            self.sim_index.add(sim.id, sim.position)
+
+    def _migrate_legacy_map(self) -> None:
+        """
+        Splits a single-file map.json and its journal into location shards.
+        The legacy files are left untouched.
+        """
+        logger.info("Migrating map.json into location shards")
+        legacy_map = Map(**json.loads(self.settings.map_storage_path.read_text()))
+        legacy_journal = Journal(get_journal_path(self.settings.map_storage_path))
+        for record in legacy_journal.read():
+            match record["type"]:
+                case "location":
+                    location = LOCATION_ADAPTER.validate_python(record["location"])
+                    legacy_map.locations[location.id] = location
+                case "location_removed":
+                    legacy_map.locations.pop(record["location_id"], None)
+                case _:
+                    location = legacy_map.locations[record["location_id"]]
+                    replay_location_records(location, [record])
+        for location_id, location in legacy_map.locations.items():
+            self.map.locations[location_id] = location
+        self.save_map()
+
+    def _replay_characters_journal(self) -> None:
+        npc_characters = self.character_storage.npc_characters
+        for record in self.characters_journal.read():
+            match record["type"]:
+                case "sim":
+                    sim = Sim(**record["sim"])
+                    npc_characters[sim.id] = sim
+                case "sim_removed":
+                    npc_characters.pop(record["sim_id"], None)
+
     def get_location(self, location_id: int) -> ANY_LOCATION:
         return self.map.locations[location_id]
 
@@ -61,31 +131,98 @@ class StorageHandler:
 
     def get_sims(self, position: Position, radius: int) -> list[Sim]:
         return [
-            sim
-            for sim in self.character_storage.npc_characters.values()
-            if sim.position.is_close(position, radius)
+            self.character_storage.npc_characters[sim_id]
+            for sim_id in self.sim_index.query(position, radius)
         ]
 
+    def mark_sim_dirty(self, sim_id: int) -> None:
+        self.dirty_sim_ids.add(sim_id)
+
+    def mark_location_dirty(self, location_id: int) -> None:
+        """
+        Rewrites the whole shard of the location on the next save.
+        """
+        self.map.locations.mark_dirty(location_id)
+
+    def add_sim(self, sim: Sim) -> None:
+        self.character_storage.npc_characters[sim.id] = sim
+        self.sim_index.add(sim.id, sim.position)
+        self.mark_sim_dirty(sim.id)
+
+    def remove_sim(self, sim_id: int) -> None:
+        self.character_storage.npc_characters.pop(sim_id, None)
+        self.sim_index.remove(sim_id)
+        self.mark_sim_dirty(sim_id)
+
+    def move_sim(self, sim_id: int, position: Position) -> None:
+        """
+        The only way to change the position of a sim, that keeps the sim index in sync.
+        """
+        sim = self.character_storage.npc_characters[sim_id]
+        sim.position = position
+        self.sim_index.move(sim_id, position)
+        self.mark_sim_dirty(sim_id)
+
     def get_objects(self, position: Position, radius: int) -> list[Object]:
-        objects = []
         location_id = position.location_id
         location = self.get_location(location_id)
+        if isinstance(location, Region):
+            return location.get_objects_in_radius(position, radius)
+        objects = []
         for obj in location.objects.values():
             if position.is_close(obj.position, radius):
                 objects.append(obj)
         return objects
 
+    @timed("storage.save_map")
     def save_map(self):
-        json_text = self.map.model_dump_json(indent=2)
-        self.settings.map_storage_path.write_text(json_text, encoding="utf-8")
+        """
+        Writes new and changed locations as whole shards and appends the changed
+        region objects of the other loaded locations to their shard journals.
+        """
+        self.map.save()
 
+    @timed("storage.save_characters")
     def save_characters(self):
-        json_text = self.character_storage.model_dump_json(indent=2)
-        self.settings.characters_storage_path.write_text(json_text, encoding="utf-8")
-
+        """
+        Appends the sims marked dirty, added or removed since the last save to the journal.
+        """
+        npc_characters = self.character_storage.npc_characters
+        dirty_sim_ids = self.dirty_sim_ids | (
+            npc_characters.keys() - self.saved_sim_ids
+        )
+        dirty_sim_ids |= self.saved_sim_ids - npc_characters.keys()
+        records = []
+        for sim_id in sorted(dirty_sim_ids):
+            if sim_id in npc_characters:
+                sim = npc_characters[sim_id]
+                records.append({"type": "sim", "sim": sim.model_dump(mode="json")})
+            elif sim_id in self.saved_sim_ids:
+                records.append({"type": "sim_removed", "sim_id": sim_id})
+        self.dirty_sim_ids = set()
+        self.saved_sim_ids = set(npc_characters.keys())
+
+        self.characters_journal.append(records)
+        if (
+            self.characters_journal.record_count
+            >= self.settings.journal_compaction_records
+        ):
+            self.compact_characters()
+
+    @timed("storage.compact_characters")
+    def compact_characters(self):
+        self.characters_codec.write(
+            self.settings.characters_storage_path, self.character_storage
+        )
+        self.characters_journal.clear()
+
+    @timed("storage.save_game")
     def save_game(self):
         json_text = self.game_storage.model_dump_json(indent=2)
-        self.settings.game_storage_path.write_text(json_text, encoding="utf-8")
+        if json_text == self.saved_game_json:
+            return
+        write_atomic(self.settings.game_storage_path, json_text)
+        self.saved_game_json = json_text
 
     def get_existing_names(self) -> set[str]:
         return {
@@ -5,6 +5,7 @@ from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.output_parsers import StrOutputParser
 
 from story_master.log import logger
+from story_master.metrics import timed
 
 
 class SummaryHandler:
@@ -47,6 +48,7 @@ class SummaryHandler:
             logger.error(f"SummaryHandler. Could not parse: {output}")
             return None
 
+    @timed("generator.summary")
     def get_summary(self, context: str, information: str):
         summary = self.chain.invoke(
             {
@@ -57,3 +59,15 @@ class SummaryHandler:
         if summary:
             return summary
         return information
+
+    @timed("generator.summary")
+    async def aget_summary(self, context: str, information: str):
+        summary = await self.chain.ainvoke(
+            {
+                "context": context,
+                "information": information,
+            }
+        )
+        if summary:
+            return summary
+        return information
@@ -1,10 +1,16 @@
+import itertools
 from abc import ABC, abstractmethod
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
 from typing_extensions import Self
 
+from story_master.entities.object_index import ObjectSpatialIndex, Footprint
+
 DEFAULT_WORLD_WIDTH = 3
 DEFAULT_WORLD_HEIGHT = 3
 
+# Unique across all regions, so a reloaded region never reuses an old version
+_object_versions = itertools.count()
+
 
 class Position(BaseModel):
     location_id: int | None
@@ -54,6 +60,13 @@ class Object(BaseModel):
         ]
         return " ".join(lines)
 
+    def get_footprint(self) -> Footprint:
+        min_x = self.position.x
+        min_y = self.position.y
+        max_x = min_x + max(self.width, 1) - 1
+        max_y = min_y + max(self.height, 1) - 1
+        return min_x, min_y, max_x, max_y
+
 
 class Building(BaseLocation):
     objects: dict[int, Object] = dict()
@@ -74,6 +87,60 @@ class Building(BaseLocation):
 
 class Region(BaseLocation):
     objects: dict[int, Object] = dict()
+    _object_index: ObjectSpatialIndex | None = PrivateAttr(default=None)
+    _dirty_object_ids: set[int] = PrivateAttr(default_factory=set)
+    _object_version: int = PrivateAttr(default_factory=lambda: next(_object_versions))
+
+    def _get_object_index(self) -> ObjectSpatialIndex:
+        # Rebuild if objects were assigned to the dict directly
+        object_index = self._object_index
+        if object_index is None or len(object_index) != len(self.objects):
+            # Publish only a complete index, patches can be generated from several threads
+            object_index = ObjectSpatialIndex()
+            for obj in self.objects.values():
+                object_index.add(obj.id, obj.get_footprint())
+            self._object_index = object_index
+            self._object_version = next(_object_versions)
+        return object_index
+
+    def get_object_version(self) -> int:
+        """
+        Changes every time objects are added or removed.
+        """
+        self._get_object_index()
+        return self._object_version
+
+    def add_object(self, obj: Object) -> None:
+        self.objects[obj.id] = obj
+        self._dirty_object_ids.add(obj.id)
+        self._object_version = next(_object_versions)
+        if self._object_index is not None:
+            self._object_index.add(obj.id, obj.get_footprint())
+
+    def remove_object(self, object_id: int) -> Object | None:
+        obj = self.objects.pop(object_id, None)
+        self._dirty_object_ids.add(object_id)
+        self._object_version = next(_object_versions)
+        if self._object_index is not None:
+            self._object_index.remove(object_id)
+        return obj
+
+    def pop_dirty_object_ids(self) -> set[int]:
+        dirty_object_ids = self._dirty_object_ids
+        self._dirty_object_ids = set()
+        return dirty_object_ids
+
+    def get_objects_in_rect(
+        self, min_x: int, min_y: int, max_x: int, max_y: int
+    ) -> list[Object]:
+        object_ids = self._get_object_index().query_rect(min_x, min_y, max_x, max_y)
+        return [self.objects[object_id] for object_id in object_ids]
+
+    def get_objects_in_radius(self, position: Position, radius: int) -> list[Object]:
+        object_ids = self._get_object_index().query_radius(
+            position.x, position.y, radius
+        )
+        return [self.objects[object_id] for object_id in object_ids]
 
     def get_description(self) -> str:
         lines = [
@@ -12,6 +12,7 @@ class MemoryTag(StrEnum):
     INVENTORY = "inventory"
     PLAN = "plan"
     OBJECT = "object"
+    EVENT = "event"
 
 
 class MemoryEntry(BaseModel):
@@ -27,3 +28,22 @@ class MemoryEntry(BaseModel):
 class Memory(BaseModel):
     entries: list[MemoryEntry] = []
     plan: str = ""
+
+
+class NewMemory(BaseModel):
+    memory_owner_id: int
+    content: str
+    tag: MemoryTag | None = None
+    importance: int = 5
+    related_entity_id: int | None = None
+    position: Position | None = None
+
+
+class ScoredMemory(BaseModel):
+    content: str
+    timestamp: datetime
+    tag: MemoryTag | None = None
+    importance: int
+    related_entity_id: int | None = None
+    position: Position | None = None
+    score: float
@@ -0,0 +1,72 @@
+from collections import defaultdict
+
+OBJECT_CHUNK_SIZE = 16
+
+# min_x, min_y, max_x, max_y - inclusive cell bounds
+Footprint = tuple[int, int, int, int]
+
+
+class ObjectSpatialIndex:
+    """
+    Chunked index of object ids.
+    An object is registered in every chunk its width x height footprint covers,
+    so rectangle queries only visit the chunks overlapping the rectangle.
+    """
+
+    def __init__(self, chunk_size: int = OBJECT_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.chunks: dict[tuple[int, int], set[int]] = defaultdict(set)
+        self.object_chunks: dict[int, list[tuple[int, int]]] = dict()
+        self.footprints: dict[int, Footprint] = dict()
+
+    def __len__(self) -> int:
+        return len(self.footprints)
+
+    def _get_chunk_range(
+        self, min_x: int, min_y: int, max_x: int, max_y: int
+    ) -> list[tuple[int, int]]:
+        return [
+            (cx, cy)
+            for cx in range(min_x // self.chunk_size, max_x // self.chunk_size + 1)
+            for cy in range(min_y // self.chunk_size, max_y // self.chunk_size + 1)
+        ]
+
+    def add(self, object_id: int, footprint: Footprint) -> None:
+        if object_id in self.footprints:
+            self.remove(object_id)
+        keys = self._get_chunk_range(*footprint)
+        for key in keys:
+            self.chunks[key].add(object_id)
+        self.object_chunks[object_id] = keys
+        self.footprints[object_id] = footprint
+
+    def remove(self, object_id: int) -> None:
+        keys = self.object_chunks.pop(object_id, [])
+        self.footprints.pop(object_id, None)
+        for key in keys:
+            chunk = self.chunks[key]
+            chunk.discard(object_id)
+            if not chunk:
+                del self.chunks[key]
+
+    def query_rect(self, min_x: int, min_y: int, max_x: int, max_y: int) -> list[int]:
+        found = set()
+        for key in self._get_chunk_range(min_x, min_y, max_x, max_y):
+            chunk = self.chunks.get(key)
+            if not chunk:
+                continue
+            for object_id in chunk:
+                if object_id in found:
+                    continue
+                obj_min_x, obj_min_y, obj_max_x, obj_max_y = self.footprints[object_id]
+                if (
+                    obj_min_x <= max_x
+                    and obj_max_x >= min_x
+                    and obj_min_y <= max_y
+                    and obj_max_y >= min_y
+                ):
+                    found.add(object_id)
+        return sorted(found)
+
+    def query_radius(self, x: int, y: int, radius: int) -> list[int]:
+        return self.query_rect(x - radius, y - radius, x + radius, y + radius)
@@ -0,0 +1,149 @@
+import heapq
+from collections import deque
+
+import numpy as np
+
+from story_master.entities.location import Region
+from story_master.entities.object_index import Footprint
+
+# Sims can step to any of the 8 neighbouring cells, matching Position.is_close
+NEIGHBOURS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+UNREACHABLE = -1
+
+
+class OccupancyGrid:
+    """
+    Blocked cells of a rectangle of a region, built from the object footprints.
+    Cells outside of the rectangle are treated as blocked.
+    """
+
+    def __init__(self, region: Region, bounds: Footprint):
+        self.bounds = bounds
+        min_x, min_y, max_x, max_y = bounds
+        self.blocked = np.zeros((max_x - min_x + 1, max_y - min_y + 1), dtype=bool)
+        for obj in region.get_objects_in_rect(*bounds):
+            obj_min_x, obj_min_y, obj_max_x, obj_max_y = obj.get_footprint()
+            self.blocked[
+                max(obj_min_x, min_x) - min_x : min(obj_max_x, max_x) - min_x + 1,
+                max(obj_min_y, min_y) - min_y : min(obj_max_y, max_y) - min_y + 1,
+            ] = True
+
+    def is_free(self, x: int, y: int) -> bool:
+        min_x, min_y, max_x, max_y = self.bounds
+        if not (min_x <= x <= max_x and min_y <= y <= max_y):
+            return False
+        return not self.blocked[x - min_x, y - min_y]
+
+    def get_neighbours(self, x: int, y: int) -> list[tuple[int, int]]:
+        neighbours = []
+        for dx, dy in NEIGHBOURS:
+            if not self.is_free(x + dx, y + dy):
+                continue
+            # Diagonal steps can't cut the corner of an object
+            if dx and dy and not (self.is_free(x + dx, y) and self.is_free(x, y + dy)):
+                continue
+            neighbours.append((x + dx, y + dy))
+        return neighbours
+
+
+def find_path(
+    grid: OccupancyGrid, start: tuple[int, int], goal: tuple[int, int]
+) -> list[tuple[int, int]] | None:
+    """
+    A* search. Every step costs 1, so the Chebyshev distance is an exact lower bound.
+    Returns the cells after the start up to the goal, or None if the goal can't be reached.
+    """
+    if start == goal:
+        return []
+    if not grid.is_free(*goal):
+        return None
+
+    def heuristic(cell: tuple[int, int]) -> int:
+        return max(abs(cell[0] - goal[0]), abs(cell[1] - goal[1]))
+
+    previous: dict[tuple[int, int], tuple[int, int]] = dict()
+    costs = {start: 0}
+    queue = [(heuristic(start), 0, start)]
+    while queue:
+        _, cost, cell = heapq.heappop(queue)
+        if cell == goal:
+            path = []
+            while cell != start:
+                path.append(cell)
+                cell = previous[cell]
+            return path[::-1]
+        if cost > costs[cell]:
+            continue
+        for neighbour in grid.get_neighbours(*cell):
+            new_cost = cost + 1
+            if new_cost < costs.get(neighbour, new_cost + 1):
+                costs[neighbour] = new_cost
+                previous[neighbour] = cell
+                heapq.heappush(
+                    queue, (new_cost + heuristic(neighbour), new_cost, neighbour)
+                )
+    return None
+
+
+class DistanceField:
+    """
+    Steps from every cell of the grid to the closest target cell, found with one BFS.
+    Any number of paths to the target can then be followed without searching again.
+    """
+
+    def __init__(self, grid: OccupancyGrid, target_cells: list[tuple[int, int]]):
+        self.grid = grid
+        min_x, min_y, _, _ = grid.bounds
+        self.distances = np.full(grid.blocked.shape, UNREACHABLE, dtype=np.int32)
+        queue = deque()
+        for x, y in target_cells:
+            if grid.is_free(x, y) and self.distances[x - min_x, y - min_y] < 0:
+                self.distances[x - min_x, y - min_y] = 0
+                queue.append((x, y))
+        while queue:
+            x, y = queue.popleft()
+            distance = self.distances[x - min_x, y - min_y] + 1
+            for neighbour_x, neighbour_y in grid.get_neighbours(x, y):
+                if self.distances[neighbour_x - min_x, neighbour_y - min_y] < 0:
+                    self.distances[neighbour_x - min_x, neighbour_y - min_y] = distance
+                    queue.append((neighbour_x, neighbour_y))
+
+    def get_distance(self, x: int, y: int) -> int:
+        if not self.grid.is_free(x, y):
+            return UNREACHABLE
+        min_x, min_y, _, _ = self.grid.bounds
+        return int(self.distances[x - min_x, y - min_y])
+
+    def get_path(self, start: tuple[int, int]) -> list[tuple[int, int]] | None:
+        distance = self.get_distance(*start)
+        if distance == UNREACHABLE:
+            return None
+        path = []
+        cell = start
+        while distance > 0:
+            for neighbour in self.grid.get_neighbours(*cell):
+                if self.get_distance(*neighbour) == distance - 1:
+                    cell = neighbour
+                    break
+            distance -= 1
+            path.append(cell)
+        return path
+
+
+def get_adjacent_cells(footprint: Footprint) -> list[tuple[int, int]]:
+    """
+    Cells around the footprint, from which a sim can interact with the object.
+    """
+    min_x, min_y, max_x, max_y = footprint
+    return [
+        (x, y)
+        for x in range(min_x - 1, max_x + 2)
+        for y in range(min_y - 1, max_y + 2)
+        if not (min_x <= x <= max_x and min_y <= y <= max_y)
+    ]
+
+
+def expand_bounds(cells: list[tuple[int, int]], margin: int) -> Footprint:
+    xs = [x for x, _ in cells]
+    ys = [y for _, y in cells]
+    return min(xs) - margin, min(ys) - margin, max(xs) + margin, max(ys) + margin
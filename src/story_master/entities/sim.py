@@ -1,8 +1,8 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, model_validator
 from story_master.entities.character import ANY_CHARACTER
 from story_master.entities.location import Position
 from story_master.entities.inventory import Inventory
-from story_master.entities.event import Event
+from story_master.entities.event import Event, EventInbox
 
 
 class Sim(BaseModel):
@@ -11,4 +11,16 @@ class Sim(BaseModel):
     position: Position
     inventory: Inventory
     current_status: str = ""
-    events: list[Event] = []
+    inbox: EventInbox = EventInbox()
+
+    @model_validator(mode="before")
+    @classmethod
+    def migrate_events(cls, data):
+        # Older saves kept every received event in an unbounded list
+        if isinstance(data, dict) and "events" in data:
+            data = dict(data)
+            inbox = EventInbox()
+            for event in data.pop("events")[-inbox.capacity :]:
+                inbox.push(Event.model_validate(event))
+            data.setdefault("inbox", inbox)
+        return data
@@ -0,0 +1,72 @@
+from collections import defaultdict
+
+from story_master.entities.location import Position
+
+SIM_GRID_CELL_SIZE = 8
+
+CellKey = tuple[int | None, int, int]
+
+
+class SimSpatialIndex:
+    """
+    Uniform grid of sim ids, bucketed by location id and cell.
+    Radius queries only visit the cells that overlap the query square.
+    The index keeps copies of the positions, so changing sim.position in place
+    doesn't move the sim here. Every move must go through StorageHandler.move_sim.
+    """
+
+    def __init__(self, cell_size: int = SIM_GRID_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells: dict[CellKey, set[int]] = defaultdict(set)
+        self.sim_cells: dict[int, CellKey] = dict()
+        self.sim_positions: dict[int, Position] = dict()
+
+    def _get_cell_key(self, position: Position) -> CellKey:
+        return (
+            position.location_id,
+            position.x // self.cell_size,
+            position.y // self.cell_size,
+        )
+
+    def add(self, sim_id: int, position: Position) -> None:
+        if sim_id in self.sim_cells:
+            self.remove(sim_id)
+        key = self._get_cell_key(position)
+        self.cells[key].add(sim_id)
+        self.sim_cells[sim_id] = key
+        self.sim_positions[sim_id] = position.model_copy()
+
+    def remove(self, sim_id: int) -> None:
+        key = self.sim_cells.pop(sim_id, None)
+        self.sim_positions.pop(sim_id, None)
+        if key is None:
+            return
+        cell = self.cells[key]
+        cell.discard(sim_id)
+        if not cell:
+            del self.cells[key]
+
+    def move(self, sim_id: int, position: Position) -> None:
+        new_key = self._get_cell_key(position)
+        old_key = self.sim_cells.get(sim_id)
+        self.sim_positions[sim_id] = position.model_copy()
+        if old_key == new_key:
+            return
+        self.add(sim_id, position)
+
+    def query(self, position: Position, radius: int) -> list[int]:
+        min_cx = (position.x - radius) // self.cell_size
+        max_cx = (position.x + radius) // self.cell_size
+        min_cy = (position.y - radius) // self.cell_size
+        max_cy = (position.y + radius) // self.cell_size
+        found = []
+        for cx in range(min_cx, max_cx + 1):
+            for cy in range(min_cy, max_cy + 1):
+                cell = self.cells.get((position.location_id, cx, cy))
+                if not cell:
+                    continue
+                for sim_id in cell:
+                    if position.is_close(self.sim_positions[sim_id], radius):
+                        found.append(sim_id)
+        found.sort()
+        return found
@@ -17,6 +17,7 @@ from story_master.entities.character import (
 from story_master.entities.handlers.storage_handler import StorageHandler
 from story_master.entities.handlers.summary_handler import SummaryHandler
 from story_master.log import logger
+from story_master.metrics import timed
 
 
 class BaseCharacterInfo(BaseModel):
@@ -99,6 +100,7 @@ class CharacterParameterGenerator:
     def create_genders_description(self) -> str:
         return "; ".join([item.name for item in GENDERS])
 
+    @timed("generator.character_parameters")
     def generate(self, character_description: str):
         gender_description = self.create_genders_description()
         return self.chain.invoke(
@@ -137,6 +139,7 @@ class CharacterGenerator:
             appearance=appearance,
         )
 
+    @timed("generator.character")
     def generate(self, character_description: str) -> Character:
         for i in range(3):
             try:
@@ -5,6 +5,7 @@ from langchain.prompts import PromptTemplate
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.output_parsers import StrOutputParser
 from story_master.log import logger
+from story_master.metrics import timed
 
 
 class CharacterDescriptionGenerator:
@@ -50,6 +51,7 @@ class CharacterDescriptionGenerator:
             )
             raise e
 
+    @timed("generator.character_description")
     def generate(self, intent: str, location_description: str) -> str:
         character_description = self.chain.invoke(
             {"intent": intent, "location_description": location_description}
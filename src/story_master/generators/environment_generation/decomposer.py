@@ -7,6 +7,7 @@ from pydantic import BaseModel
 
 from story_master.log import logger
 from story_master.entities.location import DEFAULT_WORLD_WIDTH, DEFAULT_WORLD_HEIGHT
+from story_master.metrics import timed
 
 
 class BaseLocationInformation(BaseModel):
@@ -85,6 +86,7 @@ class MapDecomposer:
                 continue
         return parsed_regions
 
+    @timed("generator.map_decomposer")
     def generate(self) -> list[BaseLocationInformation]:
         parsed_regions = self.chain.invoke(
             {"world_height": DEFAULT_WORLD_HEIGHT, "world_width": DEFAULT_WORLD_WIDTH}
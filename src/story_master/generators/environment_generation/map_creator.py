@@ -1,8 +1,10 @@
+import contextvars
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 from langchain_core.language_models.chat_models import BaseChatModel
 from story_master.log import logger
-from story_master.entities.location import Region, Position
+from story_master.entities.location import Region, Position, Object
 from story_master.entities.handlers.summary_handler import SummaryHandler
 from story_master.entities.handlers.storage_handler import StorageHandler
 from story_master.generators.environment_generation.decomposer import MapDecomposer
@@ -12,6 +14,7 @@ from story_master.generators.environment_generation.object_generator import (
     ObjectPlacer,
     DEFAULT_GENERATION_RADIUS,
 )
+from story_master.metrics import timed
 
 THRESHOLD_OBJECTS_COUNT = (DEFAULT_GENERATION_RADIUS**2) * 0.4
 MAP_GENERATION_STRIDE = 3
@@ -23,8 +26,10 @@ class MapCreator:
         llm_model: BaseChatModel,
         storage_handler: StorageHandler,
         summary_handler: SummaryHandler,
+        generation_workers: int = 1,
     ):
         self.llm_model = llm_model
+        self.generation_workers = generation_workers
         self.storage_manager = storage_handler
         self.summary_handler = summary_handler
 
@@ -34,59 +39,148 @@ class MapCreator:
         self.object_generator = ObjectGenerator(llm_model)
         self.object_placer = ObjectPlacer(llm_model)
 
-    def generate_patch(self, center: Position) -> None:
-        start = time.time()
-        min_x = center.x - DEFAULT_GENERATION_RADIUS / 2
-        max_x = center.x + DEFAULT_GENERATION_RADIUS / 2
-        min_y = center.y - DEFAULT_GENERATION_RADIUS / 2
-        max_y = center.y + DEFAULT_GENERATION_RADIUS / 2
-        region: Region = self.storage_manager.get_location(center.location_id)
-        if not isinstance(region, Region):
-            logger.error(f"Can only generate objects in regions, got {region}")
-            return
-        objects = filter(
-            lambda obj: min_x <= obj.position.x <= max_x, region.objects.values()
+    @timed("map.generate_patch_objects")
+    def _generate_patch_objects(
+        self, region: Region, center: Position
+    ) -> list[Object] | None:
+        """
+        Runs the LLM chains for a single patch without modifying the region.
+        Returns the placed objects in region coordinates, without final ids.
+        """
+        half_size = DEFAULT_GENERATION_RADIUS // 2
+        objects = region.get_objects_in_rect(
+            center.x - half_size,
+            center.y - half_size,
+            center.x + half_size,
+            center.y + half_size,
         )
-        objects = filter(lambda obj: min_y <= obj.position.y <= max_y, objects)
         shifted_objects = []
         existing_positions = set()
         for obj in objects:
+            # Shift copies, the region objects are indexed by their positions
+            obj = obj.model_copy(deep=True)
             obj.position.x -= center.x
             obj.position.y -= center.y
             existing_positions.add((obj.position.x, obj.position.y))
             shifted_objects.append(obj)
         if len(shifted_objects) >= THRESHOLD_OBJECTS_COUNT:
             logger.info(f"Skipping generation for region {region.id}, too many objects")
-            return
+            return None
         logger.info(f"Region objects: {len(region.objects)}")
         logger.info(f"Objects in range: {len(shifted_objects)}")
 
         new_object_names = self.object_name_generator.generate(region, shifted_objects)
         logger.info(f"New generated names: {new_object_names}")
-        raw_objects = self.object_generator.generate(region, new_object_names)
-        for i, raw_object in enumerate(raw_objects):
+        raw_objects = []
+        # Objects are parsed and numbered while the model is still streaming
+        for i, raw_object in enumerate(
+            self.object_generator.stream(region, new_object_names)
+        ):
             raw_object.id = i
+            raw_objects.append(raw_object)
         placed_objects = self.object_placer.generate(
             region, shifted_objects, raw_objects
         )
-        final_new_objects = []
-        new_object_id = max(region.objects.keys()) + 1 if region.objects else 0
+        new_objects = []
         for obj in placed_objects:
             if (obj.position.x, obj.position.y) in existing_positions:
                 continue
             obj.position.x += center.x
             obj.position.y += center.y
+            new_objects.append(obj)
+        return new_objects
+
+    def _merge_patch_objects(self, region: Region, objects: list[Object]) -> None:
+        new_object_id = max(region.objects.keys()) + 1 if region.objects else 0
+        for obj in objects:
             obj.id = new_object_id
             new_object_id += 1
-            final_new_objects.append(obj)
             logger.info(
                 f"Placed object {obj.name} at {obj.position.x}, {obj.position.y}"
             )
-            region.objects[obj.id] = obj
+            region.add_object(obj)
+
+    @timed("map.generate_patch")
+    def generate_patch(self, center: Position) -> None:
+        start = time.time()
+        region: Region = self.storage_manager.get_location(center.location_id)
+        if not isinstance(region, Region):
+            logger.error(f"Can only generate objects in regions, got {region}")
+            return
+        new_objects = self._generate_patch_objects(region, center)
+        if new_objects is None:
+            return
+        self._merge_patch_objects(region, new_objects)
         logger.info(
-            f"Generated {len(final_new_objects)} objects in {time.time() - start:.2f} seconds"
+            f"Generated {len(new_objects)} objects in {time.time() - start:.2f} seconds"
         )
 
+    @staticmethod
+    def schedule_waves(centers: list[Position]) -> list[list[int]]:
+        """
+        Groups patch indexes into waves. A patch goes to the wave after the latest wave
+        of any earlier patch, whose generation window overlaps its own, so overlapping
+        patches run in the order of the list. Patches in other locations never overlap.
+        """
+        window = 2 * DEFAULT_GENERATION_RADIUS
+        patch_waves = []
+        for i, center in enumerate(centers):
+            wave = 0
+            for j in range(i):
+                other = centers[j]
+                if (
+                    other.location_id == center.location_id
+                    and abs(center.x - other.x) <= window
+                    and abs(center.y - other.y) <= window
+                ):
+                    wave = max(wave, patch_waves[j] + 1)
+            patch_waves.append(wave)
+        waves = [[] for _ in range(max(patch_waves, default=-1) + 1)]
+        for i, wave in enumerate(patch_waves):
+            waves[wave].append(i)
+        return waves
+
+    def generate_patches(self, centers: list[Position]) -> None:
+        """
+        Generates patches in waves of non overlapping windows.
+        Patches of one wave can't see each other's objects, so they run at the same time.
+        Every patch runs after the earlier patches it overlaps, so for any number of workers
+        it sees the objects of generating the list one by one, at the same positions.
+        Object ids are given in wave order. They match the sequential ids, unless
+        a wave holds patches that aren't adjacent in the list.
+        """
+        waves = self.schedule_waves(centers)
+        logger.info(f"Generating {len(centers)} patches in {len(waves)} waves")
+        with ThreadPoolExecutor(
+            max_workers=max(1, self.generation_workers)
+        ) as executor:
+            for wave in waves:
+                start = time.time()
+                patches = []
+                for i in wave:
+                    region = self.storage_manager.get_location(centers[i].location_id)
+                    if not isinstance(region, Region):
+                        logger.error(
+                            f"Can only generate objects in regions, got {region}"
+                        )
+                        continue
+                    # Worker threads don't inherit context variables, like the metrics scopes
+                    future = executor.submit(
+                        contextvars.copy_context().run,
+                        self._generate_patch_objects,
+                        region,
+                        centers[i],
+                    )
+                    patches.append((region, future))
+                for region, future in patches:
+                    new_objects = future.result()
+                    if new_objects is not None:
+                        self._merge_patch_objects(region, new_objects)
+                logger.info(
+                    f"Generated wave of {len(wave)} patches in {time.time() - start:.2f} seconds"
+                )
+
+    @timed("map.generate_area")
     def generate_area(self, center: Position, radius: int):
         """
         Move in a circle around the center and generate objects.
@@ -121,10 +215,13 @@ class MapCreator:
                 generation_coordinates.append((x, y))
                 x -= MAP_GENERATION_STRIDE
         logger.info(f"Coordinates: {generation_coordinates}")
-        for x, y in generation_coordinates:
-            position = Position(x=x, y=y, location_id=center.location_id)
-            self.generate_patch(position)
+        centers = [
+            Position(x=x, y=y, location_id=center.location_id)
+            for x, y in generation_coordinates
+        ]
+        self.generate_patches(centers)
 
+    @timed("map.create_map")
     def create_map(self) -> None:
         logger.info("Creating map")
         raw_regions = self.map_decomposer.generate()
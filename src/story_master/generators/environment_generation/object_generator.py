@@ -1,4 +1,5 @@
 import re
+from collections.abc import Iterator
 
 from langchain.prompts import PromptTemplate
 from langchain_core.language_models.chat_models import BaseChatModel
@@ -6,10 +7,26 @@ from langchain_core.output_parsers import StrOutputParser
 
 from story_master.log import logger
 from story_master.entities.location import Region, Object, Position
+from story_master.llm_cache import stream_with_cache
+from story_master.metrics import timed
 
 DEFAULT_GENERATION_RADIUS = 5
 
 
+def iterate_tag_contents(chunks: Iterator[str], pattern: re.Pattern) -> Iterator[str]:
+    """
+    Yields the content of every tag matched by the pattern, as soon as its closing tag arrives.
+    """
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk.replace("\n", " ")
+        match = pattern.search(buffer)
+        while match:
+            yield match.group(1)
+            buffer = buffer[match.end() :]
+            match = pattern.search(buffer)
+
+
 class ObjectNameGenerator:
     PROMPT = """
     You are a map generation agent for a simulation game.
@@ -46,29 +63,23 @@ class ObjectNameGenerator:
         self.llm_model = llm_model
         self.object_pattern = re.compile(r"<\s*Object\s*>(.*?)</\s*Object\s*>")
 
-        prompt = PromptTemplate.from_template(self.PROMPT)
-        self.chain = prompt | llm_model | StrOutputParser() | self.parse_output
+        self.prompt = PromptTemplate.from_template(self.PROMPT)
 
-    def parse_output(self, output: str) -> list[str]:
-        try:
-            output = output.replace("\n", " ")
-            objects = self.object_pattern.findall(output)
-            return objects
-        except Exception as e:
-            logger.error(f"ObjectNameGenerator: Error parsing output: {output}")
-            raise e
-
-    def generate(self, region: Region, objects: list[Object]) -> list[str]:
+    @timed("generator.object_names")
+    def stream(self, region: Region, objects: list[Object]) -> Iterator[str]:
         logger.info(f"Generating objects for region {region.name}")
         region_description = region.get_description()
         object_strings = [obj.get_description(add_description=False) for obj in objects]
         objects_description = " ".join(object_strings)
 
-        object_names = self.chain.invoke(
+        prompt_value = self.prompt.invoke(
             {"region": region_description, "objects": objects_description}
         )
+        chunks = stream_with_cache(self.llm_model, prompt_value)
+        yield from iterate_tag_contents(chunks, self.object_pattern)
 
-        return object_names
+    def generate(self, region: Region, objects: list[Object]) -> list[str]:
+        return list(self.stream(region, objects))
 
 
 class ObjectGenerator:
@@ -124,56 +135,53 @@ class ObjectGenerator:
         self.width_pattern = re.compile(r"<\s*Width\s*>(.*?)</\s*Width\s*>")
         self.height_pattern = re.compile(r"<\s*Height\s*>(.*?)</\s*Height\s*>")
 
-        prompt = PromptTemplate.from_template(self.PROMPT)
-        self.chain = prompt | llm_model | StrOutputParser() | self.parse_output
+        self.prompt = PromptTemplate.from_template(self.PROMPT)
 
-    def parse_output(self, output: str) -> list[Object]:
+    def parse_object(self, obj: str) -> Object | None:
         try:
-            output = output.replace("\n", " ")
-            objects = self.object_pattern.findall(output)
-        except Exception as e:
-            logger.error(f"ObjectGenerator: Error parsing output: {output}")
-            raise e
-
-        parsed_objects = []
-        for obj in objects:
-            try:
-                name = self.name_pattern.search(obj).group(1)
-                description = self.description_pattern.search(obj).group(1)
-                hidden_description = self.hidden_description_pattern.search(obj)
-                hidden_description = (
-                    hidden_description.group(1) if hidden_description else None
-                )
-                width = int(self.width_pattern.search(obj).group(1))
-                height = int(self.height_pattern.search(obj).group(1))
-
-                parsed_objects.append(
-                    Object(
-                        id=0,
-                        name=name,
-                        description=description,
-                        hidden_description=hidden_description,
-                        position=Position(x=0, y=0, location_id=None),
-                        width=width,
-                        height=height,
-                    )
-                )
-            except Exception:
-                logger.error(f"ObjectGenerator: Can't process object {obj}")
-                continue
-        return parsed_objects
-
-    def generate(self, region: Region, objects: list[str]) -> list[Object]:
+            name = self.name_pattern.search(obj).group(1)
+            description = self.description_pattern.search(obj).group(1)
+            hidden_description = self.hidden_description_pattern.search(obj)
+            hidden_description = (
+                hidden_description.group(1) if hidden_description else None
+            )
+            width = int(self.width_pattern.search(obj).group(1))
+            height = int(self.height_pattern.search(obj).group(1))
+
+            return Object(
+                id=0,
+                name=name,
+                description=description,
+                hidden_description=hidden_description,
+                position=Position(x=0, y=0, location_id=None),
+                width=width,
+                height=height,
+            )
+        except Exception:
+            logger.error(f"ObjectGenerator: Can't process object {obj}")
+            return None
+
+    @timed("generator.objects")
+    def stream(self, region: Region, objects: list[str]) -> Iterator[Object]:
+        """
+        Yields every generated object as soon as its closing tag is streamed.
+        """
         logger.info(f"Generating objects for region {region.name}")
         region_description = region.get_description()
-        object_strings = "\n".join([f"<Object>{obj}</Object>" for obj in objects])
-        objects_description = " ".join(object_strings)
+        object_strings = [f"<Object>{obj}</Object>" for obj in objects]
+        objects_description = "\n".join(object_strings)
 
-        generated_objects = self.chain.invoke(
+        prompt_value = self.prompt.invoke(
             {"region": region_description, "objects": objects_description}
         )
+        chunks = stream_with_cache(self.llm_model, prompt_value)
+        for obj in iterate_tag_contents(chunks, self.object_pattern):
+            parsed_object = self.parse_object(obj)
+            if parsed_object is not None:
+                yield parsed_object
 
-        return generated_objects
+    def generate(self, region: Region, objects: list[str]) -> list[Object]:
+        return list(self.stream(region, objects))
 
 
 class ObjectPlacer:
@@ -247,6 +255,7 @@ class ObjectPlacer:
                 continue
         return parsed_objects
 
+    @timed("generator.object_placer")
     def generate(
         self,
         region: Region,
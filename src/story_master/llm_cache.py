@@ -0,0 +1,200 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections.abc import Iterator
+from typing import Any
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.load import dumps, loads
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration
+from langchain_core.prompt_values import PromptValue
+
+from story_master.log import logger
+from story_master.settings import LLMCacheSettings
+
+# Pending access times of cache hits, that are written together
+ACCESS_FLUSH_SIZE = 256
+
+
+class LLMResponseCache(BaseCache):
+    """
+    Persistent LLM response cache stored in SQLite.
+    Entries are keyed by a hash of the llm string (model name and parameters) and the prompt.
+    When the stored responses exceed max_size_bytes, the least recently used entries are evicted.
+    Several processes can share the file, so the size is read from the database before evicting.
+    Access times of hits are kept in memory and written with the next insert,
+    or once ACCESS_FLUSH_SIZE of them are pending, so hits don't commit.
+    """
+
+    def __init__(self, database_path: str, max_size_bytes: int):
+        self.max_size_bytes = max_size_bytes
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(database_path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        # Covers the size, so summing it doesn't read the stored values
+        self.connection.execute("DROP INDEX IF EXISTS responses_last_access")
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS responses_last_access_size "
+            "ON responses (last_access, size)"
+        )
+        self.connection.commit()
+        self.size_bytes = self._read_size_bytes()
+
+        # Key -> last access time of hits, that aren't written yet
+        self.access_times: dict[str, float] = dict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _read_size_bytes(self) -> int:
+        return self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+
+    @staticmethod
+    def _get_key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> RETURN_VAL_TYPE | None:
+        key = self._get_key(prompt, llm_string)
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT value FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.access_times[key] = time.time()
+            if len(self.access_times) >= ACCESS_FLUSH_SIZE:
+                self._write_access_times()
+                self.connection.commit()
+        try:
+            return [loads(generation) for generation in json.loads(row[0])]
+        except Exception:
+            logger.error(f"LLMResponseCache. Could not load cached value {key}")
+            return None
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        key = self._get_key(prompt, llm_string)
+        value = json.dumps([dumps(generation) for generation in return_val])
+        size = len(value.encode("utf-8"))
+        if size > self.max_size_bytes:
+            return
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, last_access) "
+                "VALUES (?, ?, ?, ?)",
+                (key, value, size, time.time()),
+            )
+            # The insert holds the write lock, so no other process changes the size
+            # until the commit
+            self.size_bytes = self._read_size_bytes()
+            # Eviction orders by the access times, so they are written first
+            self._write_access_times()
+            self._evict()
+            self.connection.commit()
+
+    def _write_access_times(self) -> None:
+        if not self.access_times:
+            return
+        self.connection.executemany(
+            "UPDATE responses SET last_access = ? WHERE key = ?",
+            [(access_time, key) for key, access_time in self.access_times.items()],
+        )
+        self.access_times = dict()
+
+    def _evict(self) -> None:
+        while self.size_bytes > self.max_size_bytes:
+            row = self.connection.execute(
+                "SELECT key, size FROM responses ORDER BY last_access LIMIT 1"
+            ).fetchone()
+            if row is None:
+                break
+            self.connection.execute("DELETE FROM responses WHERE key = ?", (row[0],))
+            self.size_bytes -= row[1]
+            self.evictions += 1
+
+    def clear(self, **kwargs: Any) -> None:
+        with self.lock:
+            self.connection.execute("DELETE FROM responses")
+            self.connection.commit()
+            self.access_times = dict()
+            self.size_bytes = 0
+
+    def get_stats(self) -> dict[str, int]:
+        with self.lock:
+            entries = self.connection.execute(
+                "SELECT COUNT(*) FROM responses"
+            ).fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": entries,
+            "size_bytes": self.size_bytes,
+        }
+
+
+_caches: dict[str, LLMResponseCache] = dict()
+
+
+def get_llm_cache(cache_settings: LLMCacheSettings) -> LLMResponseCache:
+    # One cache per file, so every client shares the same counters
+    database_path = str(cache_settings.database_path)
+    if database_path not in _caches:
+        cache_settings.database_path.parent.mkdir(parents=True, exist_ok=True)
+        _caches[database_path] = LLMResponseCache(
+            database_path, cache_settings.max_size_bytes
+        )
+    return _caches[database_path]
+
+
+def get_llm_string(llm_model: BaseChatModel) -> str:
+    """
+    Returns the model part of the cache key.
+    LangChain builds it only in the private _get_llm_string, calling it gives
+    streamed answers the same key as invoke, so both share cache entries.
+    This is the only place, that depends on it.
+    """
+    return llm_model._get_llm_string()
+
+
+def stream_with_cache(
+    llm_model: BaseChatModel, prompt_value: PromptValue
+) -> Iterator[str]:
+    """
+    Streams the text of the model answer.
+    LangChain doesn't use the model cache for streaming, so the lookup and the update
+    are done here with the same key, that invoke would use.
+    """
+    cache = llm_model.cache if isinstance(llm_model.cache, BaseCache) else None
+    if cache is None:
+        for chunk in llm_model.stream(prompt_value):
+            yield chunk.content
+        return
+
+    messages = prompt_value.to_messages()
+    prompt = dumps(messages)
+    llm_string = get_llm_string(llm_model)
+    cached_generations = cache.lookup(prompt, llm_string)
+    if cached_generations:
+        yield cached_generations[0].text
+        return
+
+    content = ""
+    for chunk in llm_model.stream(messages):
+        content += chunk.content
+        yield chunk.content
+    cache.update(
+        prompt, llm_string, [ChatGeneration(message=AIMessage(content=content))]
+    )
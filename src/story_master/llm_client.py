@@ -1,12 +1,56 @@
+from typing import Any
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.embeddings import Embeddings
 from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.outputs import ChatGeneration, LLMResult
 from langchain_ollama import ChatOllama, OllamaEmbeddings
 
+from story_master.embedding_cache import get_embedding_cache
+from story_master.llm_cache import get_llm_cache
+from story_master.metrics import metrics
+from story_master.settings import Settings
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """
+    Counts LLM calls and their token usage for the active operations.
+    """
+
+    # Inline, so the handler sees the context of the operation that made the call
+    run_inline = True
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        if not metrics.enabled:
+            return
+        prompt_tokens = 0
+        completion_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                if not isinstance(generation, ChatGeneration):
+                    continue
+                usage = generation.message.usage_metadata
+                if usage:
+                    prompt_tokens += usage["input_tokens"]
+                    completion_tokens += usage["output_tokens"]
+        metrics.record_llm_call(prompt_tokens, completion_tokens)
+
 
-def get_client() -> BaseChatModel:
-    ollama = ChatOllama(model="qwen2.5:7b")
+def get_client(settings: Settings | None = None) -> BaseChatModel:
+    settings = settings or Settings()
+    cache = None
+    if settings.llm_cache.enabled:
+        cache = get_llm_cache(settings.llm_cache)
+    callbacks = None
+    if settings.metrics_enabled:
+        callbacks = [MetricsCallbackHandler()]
+    ollama = ChatOllama(model="qwen2.5:7b", cache=cache, callbacks=callbacks)
     return ollama
 
 
-def get_embeddings_client() -> OllamaEmbeddings:
+def get_embeddings_client(settings: Settings | None = None) -> Embeddings:
+    settings = settings or Settings()
     ollama = OllamaEmbeddings(model="nomic-embed-text")
+    if settings.embedding_cache.enabled:
+        return get_embedding_cache(ollama, ollama.model, settings.embedding_cache)
     return ollama
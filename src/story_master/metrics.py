@@ -0,0 +1,181 @@
+import functools
+import inspect
+import json
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from pydantic import BaseModel
+
+UNSCOPED = "llm.unscoped"
+
+# Names of the operations, that are measured in the current thread or task
+_active_scopes: ContextVar[tuple[str, ...]] = ContextVar("active_scopes", default=())
+
+
+class OperationMetrics(BaseModel):
+    count: int = 0
+    errors: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+    llm_calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+
+class MetricsRecorder:
+    """
+    Aggregates wall time, LLM calls and tokens per named operation,
+    and plain counters, like retries.
+    LLM calls are attributed to every operation, that is active when the call ends,
+    so a graph node includes the tokens of the routers it runs.
+    Disabled by default, then measured functions only pay for one attribute check.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.operations: dict[str, OperationMetrics] = dict()
+        self.counters: dict[str, int] = dict()
+
+    def _get_operation(self, name: str) -> OperationMetrics:
+        if name not in self.operations:
+            self.operations[name] = OperationMetrics()
+        return self.operations[name]
+
+    def record_time(self, name: str, seconds: float, failed: bool = False) -> None:
+        with self.lock:
+            operation = self._get_operation(name)
+            operation.count += 1
+            operation.errors += int(failed)
+            operation.total_seconds += seconds
+            operation.max_seconds = max(operation.max_seconds, seconds)
+
+    def record_llm_call(self, prompt_tokens: int, completion_tokens: int) -> None:
+        names = _active_scopes.get() or (UNSCOPED,)
+        with self.lock:
+            for name in names:
+                operation = self._get_operation(name)
+                operation.llm_calls += 1
+                operation.prompt_tokens += prompt_tokens
+                operation.completion_tokens += completion_tokens
+
+    def increment(self, name: str, amount: int = 1) -> None:
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    @contextmanager
+    def measure(self, name: str) -> Iterator[None]:
+        token = _active_scopes.set(_active_scopes.get() + (name,))
+        start = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            _active_scopes.reset(token)
+            self.record_time(name, time.perf_counter() - start, failed)
+
+    def reset(self) -> None:
+        with self.lock:
+            self.operations = dict()
+            self.counters = dict()
+
+    def to_dict(self) -> dict[str, dict]:
+        with self.lock:
+            return {
+                "operations": {
+                    name: operation.model_dump()
+                    for name, operation in sorted(self.operations.items())
+                },
+                "counters": dict(sorted(self.counters.items())),
+            }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2)
+
+    def to_prometheus(self) -> str:
+        lines = []
+        values = self.to_dict()
+        operations = values["operations"]
+        for field in OperationMetrics.model_fields:
+            metric_name = f"story_master_operation_{field}"
+            metric_type = "gauge" if field == "max_seconds" else "counter"
+            lines.append(f"# TYPE {metric_name} {metric_type}")
+            for name, operation in operations.items():
+                lines.append(f'{metric_name}{{operation="{name}"}} {operation[field]}')
+        lines.append("# TYPE story_master_events_total counter")
+        for name, value in values["counters"].items():
+            lines.append(f'story_master_events_total{{event="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRecorder()
+
+
+def _measure_generator(name: str, iterator: Iterator) -> Iterator:
+    # Only the time spent producing items is measured, not the consumer's time
+    seconds = 0.0
+    failed = False
+    try:
+        while True:
+            token = _active_scopes.set(_active_scopes.get() + (name,))
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            except BaseException:
+                failed = True
+                raise
+            finally:
+                seconds += time.perf_counter() - start
+                _active_scopes.reset(token)
+            yield item
+    finally:
+        metrics.record_time(name, seconds, failed)
+
+
+def timed(name: str) -> Callable:
+    """
+    Measures every call of the decorated function, coroutine or generator under the name.
+    """
+
+    def decorator(function: Callable) -> Callable:
+        if inspect.iscoroutinefunction(function):
+
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                if not metrics.enabled:
+                    return await function(*args, **kwargs)
+                with metrics.measure(name):
+                    return await function(*args, **kwargs)
+
+            return async_wrapper
+
+        if inspect.isgeneratorfunction(function):
+
+            @functools.wraps(function)
+            def generator_wrapper(*args, **kwargs):
+                if not metrics.enabled:
+                    return function(*args, **kwargs)
+                return _measure_generator(name, function(*args, **kwargs))
+
+            return generator_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return function(*args, **kwargs)
+            with metrics.measure(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
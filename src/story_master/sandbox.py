@@ -10,8 +10,8 @@ from story_master.settings import Settings
 # generate_memories()
 
 
-client = get_client()
 settings = Settings()
+client = get_client(settings)
 storage_handler = StorageHandler(settings)
 graph = SimActionGraph(0, client, storage_handler)
 compiled_graph = graph.compile()
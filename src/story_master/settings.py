@@ -1,5 +1,6 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from pathlib import Path
+from typing import Literal
 
 from pydantic_settings import BaseSettings
 
@@ -7,14 +8,115 @@ ROOT = Path(__file__).parents[2]
 
 
 class StorageSettings(BaseSettings):
+    # chroma keeps memories in a Chroma collection under data_file_path,
+    # numpy in memory-mapped files under memory_index_path
+    memory_backend: Literal["chroma", "numpy"] = "chroma"
     memory_collection: str = "memory_collection"
     data_file_path: Path = ROOT / "data" / "db"
+    memory_index_path: Path = ROOT / "data" / "memory_index"
+    # The numpy backend scans only the closest clusters above this many memories
+    memory_approximate_threshold: int = 100_000
+    memory_approximate_probes: int = 8
+    # 0 writes every memory immediately
+    memory_buffer_size: int = 0
+    memory_flush_interval: float = 5.0
+    # Candidates fetched from the vector store before ranking
+    memory_retrieval_candidates: int = 50
+    memory_relevance_weight: float = 1.0
+    memory_recency_weight: float = 1.0
+    memory_importance_weight: float = 1.0
+
+
+class LLMCacheSettings(BaseSettings):
+    enabled: bool = True
+    database_path: Path = ROOT / "data" / "llm_cache.sqlite"
+    max_size_bytes: int = 256 * 1024 * 1024
+
+
+class EmbeddingCacheSettings(BaseSettings):
+    enabled: bool = True
+    database_path: Path = ROOT / "data" / "embedding_cache.sqlite"
+    # Vectors kept in memory, the rest are read from the database
+    memory_entries: int = 10_000
+
+
+class SnapshotSettings(BaseSettings):
+    # binary writes versioned msgpack snapshots, json the readable indented files.
+    # Both formats are read, so saves can be switched at any time
+    format: Literal["json", "binary"] = "binary"
+    compression: bool = True
+    compression_level: int = 1
+    # Binary snapshots written with the current schema are loaded without validation
+    trusted_loads: bool = True
+
+
+class LodSettings(BaseSettings):
+    # Disabled, or without focus points, every sim decides every tick
+    enabled: bool = False
+    # Distance in cells to the closest focus point in the same location
+    focus_radius: int = 16
+    mid_radius: int = 64
+    # Mid tier sims decide once in this many ticks
+    mid_interval: int = 4
+    # Ticks a sim stays in focus after an event has reached it
+    activity_ticks: int = 3
+    # Routine of dormant sims: they sleep between these game hours,
+    # otherwise they step to a free neighbouring cell with this chance every tick
+    night_start_hour: int = 22
+    night_end_hour: int = 6
+    wander_chance: float = 0.2
+
+
+class RouterBatchSettings(BaseSettings):
+    # Router calls of many sims are sent to the model together through abatch
+    enabled: bool = False
+    # With Ollama match OLLAMA_NUM_PARALLEL, more calls than slots only queue up
+    max_batch_size: int = 8
+    # Seconds the first call of a batch waits for more calls
+    window: float = 0.02
+
+
+class DistributedSettings(BaseSettings):
+    # Processes, that each own the sims and objects of a share of the locations
+    workers: int = 4
+    # Game time, that passes in one lockstep tick
+    tick_duration: timedelta = timedelta(minutes=1)
+    # Storage of the workers, the map shards are shared by all of them
+    run_directory: Path = ROOT / "data" / "workers"
+    # Seconds to wait for the replies of the workers before the run is aborted
+    message_timeout: float = 600.0
 
 
 class Settings(BaseSettings):
     characters_storage_path: Path = ROOT / "data" / "characters.json"
     map_storage_path: Path = ROOT / "data" / "map.json"
+    map_shards_path: Path = ROOT / "data" / "map"
     game_storage_path: Path = ROOT / "data" / "game.json"
     storage: StorageSettings = StorageSettings()
+    llm_cache: LLMCacheSettings = LLMCacheSettings()
+    embedding_cache: EmbeddingCacheSettings = EmbeddingCacheSettings()
+    snapshot: SnapshotSettings = SnapshotSettings()
+    lod: LodSettings = LodSettings()
+    router_batch: RouterBatchSettings = RouterBatchSettings()
+    distributed: DistributedSettings = DistributedSettings()
 
     default_starting_time: datetime = datetime(1410, 5, 1, 10, 0, 0)
+    sim_tick_concurrency: int = 8
+    # Older messages of a sim decision are summarized above this many tokens
+    sim_history_token_budget: int = 2000
+    # Router answers without a valid tool call, that a sim can retry in one tick
+    sim_router_retry_budget: int = 3
+    # Cheap retrievals, like the nearby characters, are put into the context
+    # before the first router call instead of being asked for as tool calls
+    sim_prefetch_context: bool = True
+    map_generation_workers: int = 4
+    # Journals are folded into the snapshots after this many records
+    journal_compaction_records: int = 5000
+    # Least recently used regions are unloaded on save when more objects than this are in memory
+    map_memory_budget_objects: int = 200_000
+    # Distance fields to movement targets, kept until objects of their region change
+    movement_distance_field_cache_size: int = 64
+    # Per operation latency and token metrics, written on engine shutdown.
+    # A .prom path writes the Prometheus text format, anything else writes json
+    metrics_enabled: bool = False
+    metrics_path: Path = ROOT / "data" / "metrics.json"
@@ -1,15 +1,27 @@
-from langchain_core.messages import BaseMessage, ToolMessage
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.runnables import RunnableLambda
 from typing_extensions import TypedDict
 from langchain_core.language_models.chat_models import BaseChatModel
 from langgraph.graph import StateGraph, START, END
-from story_master.sim_agent.actions import ANY_ACTION_TYPE, ALL_ACTIONS
+from story_master.sim_agent.actions import ANY_ACTION_TYPE, ALL_ACTIONS, idle_action
 from story_master.entities.handlers.storage_handler import StorageHandler
-from story_master.sim_agent.tools import WorldRetriever
+from story_master.sim_agent.tools import (
+    PREFETCH_TOOLS,
+    WorldRetriever,
+    get_nearby_characters,
+)
 from story_master.sim_agent.action_router import ActionRouter
 from story_master.sim_agent.planning_router import (
     PlanningRouter,
 )
+from story_master.sim_agent.history_manager import MessageHistoryManager
+from story_master.entities.handlers.summary_handler import SummaryHandler
 from langchain.output_parsers import PydanticToolsParser
+from story_master.metrics import metrics, timed
+from story_master.log import logger
+
+DEFAULT_HISTORY_TOKEN_BUDGET = 2000
+DEFAULT_ROUTER_RETRY_BUDGET = 3
 
 
 class SimActionState(TypedDict):
@@ -17,41 +29,198 @@ class SimActionState(TypedDict):
     phase: int
     sim_id: int
     selected_action: ANY_ACTION_TYPE | None
+    retries: int
+    # Inbox events below this number are in the messages
+    read_until: int
 
 
 class SimActionGraph:
     def __init__(
-        self, sim_id: int, llm_client: BaseChatModel, storage_handler: StorageHandler
+        self,
+        sim_id: int,
+        llm_client: BaseChatModel,
+        storage_handler: StorageHandler,
+        summary_handler: SummaryHandler | None = None,
+        history_token_budget: int = DEFAULT_HISTORY_TOKEN_BUDGET,
+        router_retry_budget: int = DEFAULT_ROUTER_RETRY_BUDGET,
+        planning_router: PlanningRouter | None = None,
+        action_router: ActionRouter | None = None,
+        prefetch_context: bool = True,
     ):
         self.sim_id = sim_id
         self.base_client = llm_client
         self.storage_handler = storage_handler
 
-        self.planning_router = PlanningRouter(llm_client)
-        self.action_router = ActionRouter(llm_client)
+        # The routers hold no sim state, the tick runner shares them between all graphs
+        self.planning_router = planning_router or PlanningRouter(llm_client)
+        self.action_router = action_router or ActionRouter(llm_client)
         self.world_retriever = WorldRetriever(storage_handler)
+        self.history_manager = MessageHistoryManager(
+            summary_handler or SummaryHandler(llm_client), history_token_budget
+        )
+        self.router_retry_budget = router_retry_budget
+        self.prefetch_context = prefetch_context
+        # The planning router can only ask for retrievals, when all of them are
+        # prefetched it has nothing left to decide
+        self.skip_planning = all(
+            tool in PREFETCH_TOOLS for tool in PlanningRouter.RETRIEVAL_TOOLS
+        )
+        self.retrievals = {
+            get_nearby_characters: self.world_retriever.get_nearby_characters,
+        }
+
+    def _run_router(
+        self, router: PlanningRouter | ActionRouter, state: SimActionState
+    ) -> None:
+        state["messages"] = self.history_manager.compact(state["messages"])
+        ai_message = router.run(state["messages"])
+        state["messages"].append(ai_message)
+
+    async def _arun_router(
+        self, router: PlanningRouter | ActionRouter, state: SimActionState
+    ) -> None:
+        state["messages"] = await self.history_manager.acompact(state["messages"])
+        ai_message = await router.arun(state["messages"])
+        state["messages"].append(ai_message)
+
+    def _needs_retry(self, state: SimActionState, router_name: str) -> bool:
+        """
+        Checks the last router answer. Every sim has a retry budget for one graph run,
+        when it runs out the sim stays idle instead of asking the router again.
+        """
+        if state["messages"][-1].tool_calls:
+            return False
+        if state["retries"] >= self.router_retry_budget:
+            logger.warning(
+                f"Sim {self.sim_id} has no valid tool call after {state['retries']} retries, staying idle"
+            )
+            metrics.increment("router.idle_fallbacks")
+            state["selected_action"] = idle_action()
+            return False
+        state["retries"] += 1
+        metrics.increment(f"router.{router_name}.retries")
+        logger.debug(f"Sim {self.sim_id} runs the {router_name} router again")
+        return True
+
+    def _read_events(self) -> tuple[list[BaseMessage], int]:
+        """
+        Returns the unread events of the sim's inbox as a message, together with
+        the number, up to which they are marked read once an action is selected.
+        """
+        sim = self.storage_handler.get_sim(self.sim_id)
+        if sim is None:
+            return [], 0
+        events = sim.inbox.get_unread()
+        if not events:
+            return [], sim.inbox.next_number
+        event_strings = [
+            f"<Event>{event.timestamp}. {event.type}: {event.description}</Event>"
+            for event in events
+        ]
+        return [
+            HumanMessage(content=f"<NewEvents>{''.join(event_strings)}</NewEvents>")
+        ], sim.inbox.next_number
+
+    def _mark_events_read(self, state: SimActionState) -> None:
+        """
+        Moves the read cursor past the events the decision was based on.
+        Events of failed or idle decisions stay unread for the next tick.
+        """
+        sim = self.storage_handler.get_sim(self.sim_id)
+        if sim is None or sim.inbox.read_cursor >= state["read_until"]:
+            return
+        sim.inbox.mark_read(state["read_until"])
+        self.storage_handler.mark_sim_dirty(self.sim_id)
+
+    @timed("graph.prefetch")
+    def _prefetch(self) -> list[BaseMessage]:
+        """
+        Runs the cheap retrievals up front and returns them as answered tool calls,
+        so the routers see the same messages as after calling the tools themselves.
+        """
+        if self.storage_handler.get_sim(self.sim_id) is None:
+            return []
+        tool_calls = [
+            {"name": tool.__name__, "args": {}, "id": f"prefetch_{tool.__name__}"}
+            for tool in PREFETCH_TOOLS
+        ]
+        messages = [AIMessage(content="", tool_calls=tool_calls)]
+        for tool, tool_call in zip(PREFETCH_TOOLS, tool_calls):
+            messages.append(
+                ToolMessage(
+                    content=self.retrievals[tool](self.sim_id),
+                    name=tool_call["name"],
+                    tool_call_id=tool_call["id"],
+                )
+            )
+        return messages
 
     def _init_values_node(self, state: SimActionState) -> SimActionState:
+        messages, read_until = self._read_events()
+        phase = 1
+        if self.prefetch_context:
+            prefetched = self._prefetch()
+            messages.extend(prefetched)
+            if prefetched and self.skip_planning:
+                metrics.increment("graph.planning_skipped")
+                phase = 2
         return SimActionState(
-            messages=[],
-            phase=1,
+            messages=messages,
+            phase=phase,
             sim_id=self.sim_id,
             selected_action=None,
+            retries=0,
+            read_until=read_until,
         )
 
-    def _planning_node(self, state: SimActionState) -> SimActionState:
-        print("_planning_node.")
+    def _needs_planning(self, state: SimActionState) -> bool:
+        """
+        The planning router is done once it has selected to act,
+        or when the graph started in the action phase.
+        """
+        logger.debug(f"Sim {self.sim_id} enters the planning node")
         if state["phase"] == 2:
+            return False
+        logger.debug(f"Sim {self.sim_id} runs the planning router")
+        return True
+
+    def _run_router_with_retries(
+        self,
+        router: PlanningRouter | ActionRouter,
+        router_name: str,
+        state: SimActionState,
+    ) -> None:
+        self._run_router(router, state)
+        while self._needs_retry(state, router_name):
+            self._run_router(router, state)
+
+    async def _arun_router_with_retries(
+        self,
+        router: PlanningRouter | ActionRouter,
+        router_name: str,
+        state: SimActionState,
+    ) -> None:
+        await self._arun_router(router, state)
+        while self._needs_retry(state, router_name):
+            await self._arun_router(router, state)
+
+    @timed("graph.planning_node")
+    def _planning_node(self, state: SimActionState) -> SimActionState:
+        if not self._needs_planning(state):
             return state
+        self._run_router_with_retries(self.planning_router, "planning", state)
+        return self._finish_planning(state)
 
-        print("Running planning router")
-        ai_message = self.planning_router.run(state["messages"])
-        state["messages"].append(ai_message)
+    @timed("graph.planning_node")
+    async def _aplanning_node(self, state: SimActionState) -> SimActionState:
+        if not self._needs_planning(state):
+            return state
+        await self._arun_router_with_retries(self.planning_router, "planning", state)
+        return self._finish_planning(state)
 
-        while len(state["messages"][-1].tool_calls) == 0:
-            print("Running planning router again")
-            ai_message = self.planning_router.run(state["messages"])
-            state["messages"].append(ai_message)
+    def _finish_planning(self, state: SimActionState) -> SimActionState:
+        if state["selected_action"] is not None:
+            return state
         last_message = state["messages"][-1]
         tool_name = last_message.tool_calls[0]["name"]
         if "select_action" == tool_name:
@@ -59,19 +228,21 @@ class SimActionGraph:
         return state
 
     def _planning_router(self, state: SimActionState) -> str:
-        print("_planning_router")
+        if state["selected_action"] is not None:
+            return END
         if state["phase"] == 2:
             return "_action_node"
 
         last_message = state["messages"][-1]
         tool_name = last_message.tool_calls[0]["name"]
-        print("Planning router tool name", tool_name)
+        logger.debug(f"Sim {self.sim_id} planning router picked {tool_name}")
         if "select_action" == tool_name:
             return "_action_node"
         return tool_name
 
+    @timed("graph.get_nearby_characters_node")
     def _get_nearby_characters_node(self, state: SimActionState) -> SimActionState:
-        print("_get_nearby_characters_node.")
+        logger.debug(f"Sim {self.sim_id} retrieves nearby characters")
         first_tool = state["messages"][-1].tool_calls[0]
         text = self.world_retriever.get_nearby_characters(state["sim_id"])
         message = ToolMessage(
@@ -80,28 +251,35 @@ class SimActionGraph:
         state["messages"].append(message)
         return state
 
+    @timed("graph.action_node")
     def _action_node(self, state: SimActionState) -> SimActionState:
-        print("_action_node")
-        ai_message = self.action_router.run(state["messages"])
-        state["messages"].append(ai_message)
-        while len(state["messages"][-1].tool_calls) == 0:
-            print("Running action router again")
-            ai_message = self.action_router.run(state["messages"])
-            state["messages"].append(ai_message)
+        self._run_router_with_retries(self.action_router, "action", state)
+        return self._finish_action(state)
+
+    @timed("graph.action_node")
+    async def _aaction_node(self, state: SimActionState) -> SimActionState:
+        await self._arun_router_with_retries(self.action_router, "action", state)
+        return self._finish_action(state)
+
+    def _finish_action(self, state: SimActionState) -> SimActionState:
+        if state["selected_action"] is not None:
+            return state
         last_message = state["messages"][-1]
         tool_name = last_message.tool_calls[0]["name"]
         if "action" in tool_name:
-            parser = PydanticToolsParser(tools=ALL_ACTIONS)
+            parser = PydanticToolsParser(tools=ALL_ACTIONS, first_tool_only=True)
             parsed_action = parser.invoke(last_message)
             state["selected_action"] = parsed_action
-            print("Parsed action", parsed_action)
+            self._mark_events_read(state)
+            logger.debug(f"Sim {self.sim_id} selected {parsed_action!r}")
         return state
 
     def _action_router(self, state: SimActionState):
-        print("_action_router")
+        if state["selected_action"] is not None:
+            return END
         last_message = state["messages"][-1]
         tool_name = last_message.tool_calls[0]["name"]
-        print("Second router tool name", tool_name)
+        logger.debug(f"Sim {self.sim_id} action router picked {tool_name}")
         if "action" in tool_name:
             return END
         return tool_name
@@ -109,8 +287,15 @@ class SimActionGraph:
     def compile(self):
         graph_builder = StateGraph(SimActionState)
         graph_builder.add_node("init", self._init_values_node)
-        graph_builder.add_node("_planning_node", self._planning_node)
-        graph_builder.add_node("_action_node", self._action_node)
+        # Sync and async variants, so the graph supports both invoke and ainvoke
+        graph_builder.add_node(
+            "_planning_node",
+            RunnableLambda(self._planning_node, afunc=self._aplanning_node),
+        )
+        graph_builder.add_node(
+            "_action_node",
+            RunnableLambda(self._action_node, afunc=self._aaction_node),
+        )
         graph_builder.add_node(
             "get_nearby_characters", self._get_nearby_characters_node
         )
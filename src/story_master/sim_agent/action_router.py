@@ -3,6 +3,10 @@ from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.messages import AIMessage
 from story_master.sim_agent.tools import get_nearby_characters
 from story_master.sim_agent.actions import speak_action
+from story_master.metrics import timed
+from story_master.sim_agent.tool_call_repair import ToolCallRepairer
+from story_master.sim_agent.request_batcher import RequestBatcher
+from story_master.settings import RouterBatchSettings
 
 
 class ActionRouter:
@@ -34,9 +38,14 @@ It can contain agent decisions, tool calls and other information.
 Output:
     """
 
-    def __init__(self, llm_client: BaseChatModel):
+    def __init__(
+        self,
+        llm_client: BaseChatModel,
+        batch_settings: RouterBatchSettings | None = None,
+    ):
         available_tools = [get_nearby_characters, speak_action]
         self.bound_llm = llm_client.bind_tools(available_tools, tool_choice="any")
+        self.tool_call_repairer = ToolCallRepairer(available_tools)
 
         prompt_template = ChatPromptTemplate(
             [("system", self.PROMPT), MessagesPlaceholder("messages")]
@@ -44,7 +53,19 @@ Output:
         self.chain = (
             prompt_template | self.bound_llm
         )  # | PydanticToolsParser(tools=available_tools)
+        # Shared by the graphs of many sims, their async calls go out together
+        self.runnable = self.chain
+        if batch_settings is not None and batch_settings.enabled:
+            self.runnable = RequestBatcher(
+                self.chain, batch_settings.max_batch_size, batch_settings.window
+            )
 
+    @timed("router.action")
     def run(self, messages: list) -> AIMessage:
         ai_message: AIMessage = self.chain.invoke({"messages": messages})
-        return ai_message
+        return self.tool_call_repairer.repair(ai_message)
+
+    @timed("router.action")
+    async def arun(self, messages: list) -> AIMessage:
+        ai_message: AIMessage = await self.runnable.ainvoke({"messages": messages})
+        return self.tool_call_repairer.repair(ai_message)
@@ -16,5 +16,11 @@ class speak_action(BaseModel):
     )
 
 
-ANY_ACTION_TYPE = speak_action
-ALL_ACTIONS = [speak_action]
+class idle_action(BaseModel):
+    """
+    This action represents character's decision to do nothing this turn.
+    """
+
+
+ANY_ACTION_TYPE = speak_action | idle_action
+ALL_ACTIONS = [speak_action, idle_action]
@@ -0,0 +1,92 @@
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+
+from story_master.entities.handlers.summary_handler import SummaryHandler
+from story_master.log import logger
+from story_master.metrics import timed
+
+CHARACTERS_PER_TOKEN = 4
+KEEP_LAST_MESSAGES = 2
+
+
+def count_tokens(messages: list[BaseMessage]) -> int:
+    """
+    Approximate token count, the local models don't expose a tokenizer.
+    """
+    characters = 0
+    for message in messages:
+        characters += len(str(message.content))
+        if isinstance(message, AIMessage):
+            characters += sum(len(str(call)) for call in message.tool_calls)
+    return characters // CHARACTERS_PER_TOKEN
+
+
+class MessageHistoryManager:
+    """
+    Keeps the messages of a single graph run within a token budget.
+    When the budget is exceeded, everything but the latest messages is collapsed
+    into one summary message.
+    """
+
+    CONTEXT = (
+        "The information was collected by a character in a simulation game, "
+        "while deciding what to do next. Keep every fact, that can help to choose an action, "
+        "like character ids, names and positions."
+    )
+
+    def __init__(self, summary_handler: SummaryHandler, token_budget: int):
+        self.summary_handler = summary_handler
+        self.token_budget = token_budget
+
+    def _split(
+        self, messages: list[BaseMessage]
+    ) -> tuple[list[BaseMessage], list[BaseMessage]] | None:
+        if count_tokens(messages) <= self.token_budget:
+            return None
+        split_index = max(len(messages) - KEEP_LAST_MESSAGES, 0)
+        # Tool results must stay right after the tool call they answer
+        while split_index > 0 and isinstance(messages[split_index], ToolMessage):
+            split_index -= 1
+        if split_index == 0:
+            return None
+        return messages[:split_index], messages[split_index:]
+
+    @staticmethod
+    def _get_information(messages: list[BaseMessage]) -> str:
+        lines = []
+        for message in messages:
+            if isinstance(message, ToolMessage):
+                lines.append(f"Result of {message.name}: {message.content}")
+            elif isinstance(message, AIMessage):
+                if message.content:
+                    lines.append(f"Reasoning: {message.content}")
+            else:
+                lines.append(str(message.content))
+        return "\n".join(lines)
+
+    @staticmethod
+    def _create_summary_message(summary: str) -> HumanMessage:
+        return HumanMessage(content=f"<PreviousContext>{summary}</PreviousContext>")
+
+    @timed("graph.compact_history")
+    def compact(self, messages: list[BaseMessage]) -> list[BaseMessage]:
+        split = self._split(messages)
+        if split is None:
+            return messages
+        old_messages, recent_messages = split
+        logger.info(f"Collapsing {len(old_messages)} messages into a summary")
+        summary = self.summary_handler.get_summary(
+            self.CONTEXT, self._get_information(old_messages)
+        )
+        return [self._create_summary_message(summary)] + recent_messages
+
+    @timed("graph.compact_history")
+    async def acompact(self, messages: list[BaseMessage]) -> list[BaseMessage]:
+        split = self._split(messages)
+        if split is None:
+            return messages
+        old_messages, recent_messages = split
+        logger.info(f"Collapsing {len(old_messages)} messages into a summary")
+        summary = await self.summary_handler.aget_summary(
+            self.CONTEXT, self._get_information(old_messages)
+        )
+        return [self._create_summary_message(summary)] + recent_messages
@@ -0,0 +1,153 @@
+import random
+from enum import StrEnum
+
+from story_master.entities.handlers.storage_handler import StorageHandler
+from story_master.entities.location import Position, Region
+from story_master.entities.pathfinding import OccupancyGrid, expand_bounds
+from story_master.entities.sim import Sim
+from story_master.metrics import metrics
+from story_master.settings import LodSettings
+from story_master.sim_agent.actions import idle_action
+
+SLEEPING_STATUS = "Sleeping"
+WANDERING_STATUS = "Wandering around"
+
+
+class DetailTier(StrEnum):
+    # Full LLM decision every tick
+    FOCUS = "focus"
+    # Full LLM decision every few ticks
+    MID = "mid"
+    # Rule-based routine, no LLM calls
+    DORMANT = "dormant"
+
+
+class DormantRoutine:
+    """
+    Rule-based update of dormant sims, that doesn't ask the model.
+    The routine follows the game clock: at night sims sleep in place, during the day
+    they sometimes step to a free neighbouring cell. Steps are seeded by the sim id
+    and the game time, so runs are repeatable.
+    """
+
+    def __init__(self, storage_handler: StorageHandler, lod_settings: LodSettings):
+        self.storage_handler = storage_handler
+        self.settings = lod_settings
+
+    def _is_night(self) -> bool:
+        hour = self.storage_handler.game_storage.current_time.hour
+        return (
+            hour >= self.settings.night_start_hour
+            or hour < self.settings.night_end_hour
+        )
+
+    def _wander(self, sim: Sim, rng: random.Random) -> None:
+        if rng.random() >= self.settings.wander_chance:
+            return
+        region = self.storage_handler.get_location(sim.position.location_id)
+        if not isinstance(region, Region):
+            return
+        cell = (sim.position.x, sim.position.y)
+        grid = OccupancyGrid(region, expand_bounds([cell], 1))
+        neighbours = grid.get_neighbours(*cell)
+        if not neighbours:
+            return
+        x, y = rng.choice(neighbours)
+        self.storage_handler.move_sim(sim.id, Position(location_id=region.id, x=x, y=y))
+        metrics.increment("lod.dormant_steps")
+
+    def update(self, sim_id: int) -> idle_action:
+        sim = self.storage_handler.get_sim(sim_id)
+        if sim is None:
+            return idle_action()
+        current_time = self.storage_handler.game_storage.current_time
+        status = SLEEPING_STATUS if self._is_night() else WANDERING_STATUS
+        if sim.current_status != status:
+            sim.current_status = status
+            self.storage_handler.mark_sim_dirty(sim_id)
+        if status == WANDERING_STATUS:
+            self._wander(sim, random.Random(f"{sim_id}:{current_time.isoformat()}"))
+        return idle_action()
+
+
+class LodScheduler:
+    """
+    Decides how much simulation every sim gets in a tick.
+    Sims close to a focus point, like the player or an ongoing scene, and sims,
+    that were reached by events recently, are in focus and decide every tick.
+    Sims a bit further away decide every mid_interval ticks, staggered by id
+    so the load is spread. The rest are dormant and follow the routine without asking
+    the model, until an event reaches their inbox.
+    Without focus points every sim is in focus.
+    """
+
+    def __init__(self, storage_handler: StorageHandler, lod_settings: LodSettings):
+        self.storage_handler = storage_handler
+        self.settings = lod_settings
+        self.focus_points: list[Position] = []
+        self.tick = 0
+        # Inbox event numbers seen at the last schedule, and the tick an event came in
+        self.event_numbers: dict[int, int] = dict()
+        self.last_event_ticks: dict[int, int] = dict()
+        self.routine = DormantRoutine(storage_handler, lod_settings)
+
+    def set_focus_points(self, focus_points: list[Position]) -> None:
+        self.focus_points = list(focus_points)
+
+    def _is_active(self, sim: Sim) -> bool:
+        inbox = sim.inbox
+        if inbox.next_number != self.event_numbers.setdefault(
+            sim.id, inbox.next_number
+        ):
+            self.event_numbers[sim.id] = inbox.next_number
+            self.last_event_ticks[sim.id] = self.tick
+        if inbox.read_cursor < inbox.next_number:
+            return True
+        last_event_tick = self.last_event_ticks.get(sim.id)
+        return (
+            last_event_tick is not None
+            and self.tick - last_event_tick <= self.settings.activity_ticks
+        )
+
+    def get_tier(self, sim: Sim) -> DetailTier:
+        if not self.focus_points or self._is_active(sim):
+            return DetailTier.FOCUS
+        distances = [
+            max(abs(sim.position.x - point.x), abs(sim.position.y - point.y))
+            for point in self.focus_points
+            if point.location_id == sim.position.location_id
+        ]
+        if not distances:
+            return DetailTier.DORMANT
+        distance = min(distances)
+        if distance <= self.settings.focus_radius:
+            return DetailTier.FOCUS
+        if distance <= self.settings.mid_radius:
+            return DetailTier.MID
+        return DetailTier.DORMANT
+
+    def plan_tick(self, sim_ids: list[int]) -> tuple[list[int], list[int]]:
+        """
+        Returns the sims, that decide with the full graph this tick, and the dormant ones.
+        Mid tier sims, that aren't due, are left out of both.
+        """
+        decide_ids = []
+        dormant_ids = []
+        tier_counts = {tier: 0 for tier in DetailTier}
+        for sim_id in sim_ids:
+            sim = self.storage_handler.get_sim(sim_id)
+            if sim is None:
+                continue
+            tier = self.get_tier(sim)
+            tier_counts[tier] += 1
+            if tier == DetailTier.FOCUS:
+                decide_ids.append(sim_id)
+            elif tier == DetailTier.MID:
+                if (self.tick + sim_id) % self.settings.mid_interval == 0:
+                    decide_ids.append(sim_id)
+            else:
+                dormant_ids.append(sim_id)
+        for tier, count in tier_counts.items():
+            metrics.increment(f"lod.{tier}", count)
+        self.tick += 1
+        return decide_ids, dormant_ids
@@ -0,0 +1,64 @@
+import asyncio
+from typing import Any
+
+from langchain_core.runnables import Runnable
+
+from story_master.metrics import metrics
+
+
+class RequestBatcher:
+    """
+    Collects calls of one runnable from many sims and sends them together through abatch.
+    A batch is sent when max_batch_size calls are waiting, or window seconds after
+    the first call of the batch. Every caller awaits the result of its own input.
+    """
+
+    def __init__(self, runnable: Runnable, max_batch_size: int, window: float):
+        self.runnable = runnable
+        self.max_batch_size = max_batch_size
+        self.window = window
+        self.pending: list[tuple[Any, asyncio.Future]] = []
+        self.timer: asyncio.TimerHandle | None = None
+        # Running batches, referenced until they finish
+        self.tasks: set[asyncio.Task] = set()
+
+    async def ainvoke(self, input: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((input, future))
+        if len(self.pending) >= self.max_batch_size:
+            self._send()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.window, self._send)
+        return await future
+
+    def _send(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        while self.pending:
+            batch = self.pending[: self.max_batch_size]
+            self.pending = self.pending[self.max_batch_size :]
+            task = asyncio.ensure_future(self._run_batch(batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _run_batch(self, batch: list[tuple[Any, asyncio.Future]]) -> None:
+        metrics.increment("router.batches")
+        metrics.increment("router.batched_requests", len(batch))
+        try:
+            outputs = await self.runnable.abatch(
+                [input for input, _ in batch],
+                config={"max_concurrency": self.max_batch_size},
+                return_exceptions=True,
+            )
+        except Exception as error:
+            outputs = [error] * len(batch)
+        for (_, future), output in zip(batch, outputs):
+            # The caller may have been cancelled in the meantime
+            if future.done():
+                continue
+            if isinstance(output, BaseException):
+                future.set_exception(output)
+            else:
+                future.set_result(output)
@@ -0,0 +1,151 @@
+import asyncio
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langgraph.graph.state import CompiledStateGraph
+
+from story_master.entities.event import Event, EventType, SimReference
+from story_master.entities.handlers.event_handler import EventHandler
+from story_master.entities.handlers.memory_handler import MemoryHandler
+from story_master.entities.handlers.storage_handler import StorageHandler
+from story_master.entities.handlers.summary_handler import SummaryHandler
+from story_master.log import logger
+from story_master.sim_agent.action_graph import SimActionGraph
+from story_master.sim_agent.actions import ANY_ACTION_TYPE, idle_action, speak_action
+from story_master.sim_agent.lod_scheduler import LodScheduler
+from story_master.sim_agent.action_router import ActionRouter
+from story_master.sim_agent.planning_router import PlanningRouter
+from story_master.settings import RouterBatchSettings
+from story_master.metrics import timed
+
+SPEECH_RADIUS = 3
+
+
+class SimTickRunner:
+    """
+    Runs the decisions of all sims for one tick concurrently.
+    Every sim's graph is awaited through ainvoke, limited by a semaphore.
+    Actions are applied only after all decisions are in, ordered by sim id,
+    and their events are dispatched in one batch.
+    With a scheduler, a tick of all sims decides only for the sims it picks,
+    dormant sims follow a rule-based routine without asking the model.
+    All graphs share one planning and one action router, with batching enabled
+    their calls are collected and sent to the model in batches.
+    """
+
+    def __init__(
+        self,
+        llm_client: BaseChatModel,
+        storage_handler: StorageHandler,
+        event_handler: EventHandler,
+        summary_handler: SummaryHandler,
+        max_concurrency: int,
+        history_token_budget: int,
+        router_retry_budget: int,
+        scheduler: LodScheduler | None = None,
+        batch_settings: RouterBatchSettings | None = None,
+        prefetch_context: bool = True,
+    ):
+        self.llm_client = llm_client
+        self.storage_handler = storage_handler
+        self.event_handler = event_handler
+        self.summary_handler = summary_handler
+        self.max_concurrency = max_concurrency
+        self.history_token_budget = history_token_budget
+        self.router_retry_budget = router_retry_budget
+        self.scheduler = scheduler
+        self.prefetch_context = prefetch_context
+        self.planning_router = PlanningRouter(llm_client, batch_settings)
+        self.action_router = ActionRouter(llm_client, batch_settings)
+        self.compiled_graphs: dict[int, CompiledStateGraph] = dict()
+
+    def _get_graph(self, sim_id: int) -> CompiledStateGraph:
+        if sim_id not in self.compiled_graphs:
+            graph = SimActionGraph(
+                sim_id,
+                self.llm_client,
+                self.storage_handler,
+                self.summary_handler,
+                self.history_token_budget,
+                self.router_retry_budget,
+                self.planning_router,
+                self.action_router,
+                self.prefetch_context,
+            )
+            self.compiled_graphs[sim_id] = graph.compile()
+        return self.compiled_graphs[sim_id]
+
+    @timed("tick.decide")
+    async def _decide(
+        self, sim_id: int, semaphore: asyncio.Semaphore
+    ) -> ANY_ACTION_TYPE | None:
+        async with semaphore:
+            output = await self._get_graph(sim_id).ainvoke({})
+        return output["selected_action"]
+
+    async def decide_all(self, sim_ids: list[int]) -> dict[int, ANY_ACTION_TYPE | None]:
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        results = await asyncio.gather(
+            *[self._decide(sim_id, semaphore) for sim_id in sim_ids],
+            return_exceptions=True,
+        )
+        decisions = dict()
+        for sim_id, result in zip(sim_ids, results):
+            if isinstance(result, BaseException):
+                logger.error(f"Sim {sim_id} failed to decide an action: {result}")
+                decisions[sim_id] = None
+            else:
+                decisions[sim_id] = result
+        return decisions
+
+    def apply_action(self, sim_id: int, action: ANY_ACTION_TYPE) -> None:
+        sim = self.storage_handler.get_sim(sim_id)
+        if sim is None:
+            logger.error(f"Can't apply action for missing sim {sim_id}")
+            return
+        if isinstance(action, speak_action):
+            event = Event(
+                type=EventType.SPEECH,
+                description=action.speech,
+                position=sim.position,
+                radius=SPEECH_RADIUS,
+                source=SimReference(sim_id=sim_id),
+                target=SimReference(sim_id=action.another_character_id),
+                timestamp=self.storage_handler.game_storage.current_time,
+            )
+            self.event_handler.queue_event(event)
+        elif isinstance(action, idle_action):
+            logger.info(f"Sim {sim_id} stays idle")
+        else:
+            logger.error(f"Unknown action type {action}")
+
+    @timed("tick.run")
+    async def arun_tick(
+        self, sim_ids: list[int] | None = None
+    ) -> dict[int, ANY_ACTION_TYPE | None]:
+        dormant_ids = []
+        if sim_ids is None:
+            sim_ids = list(self.storage_handler.character_storage.npc_characters.keys())
+            if self.scheduler is not None:
+                sim_ids, dormant_ids = self.scheduler.plan_tick(sorted(sim_ids))
+        sim_ids = sorted(sim_ids)
+        decisions = await self.decide_all(sim_ids)
+        for sim_id in sim_ids:
+            action = decisions[sim_id]
+            if action is not None:
+                self.apply_action(sim_id, action)
+        # Dormant sims follow the rule-based routine until an event comes
+        for sim_id in dormant_ids:
+            decisions[sim_id] = self.scheduler.routine.update(sim_id)
+        if dormant_ids:
+            logger.info(f"{len(dormant_ids)} dormant sims followed their routine")
+        self.event_handler.flush()
+        # Buffered memories are written at the end of the first tick after the flush
+        # interval, even if no new memory arrives
+        if isinstance(self.event_handler.memory_handler, MemoryHandler):
+            self.event_handler.memory_handler.flush_if_due()
+        return decisions
+
+    def run_tick(
+        self, sim_ids: list[int] | None = None
+    ) -> dict[int, ANY_ACTION_TYPE | None]:
+        return asyncio.run(self.arun_tick(sim_ids))
@@ -0,0 +1,128 @@
+import json
+import re
+import uuid
+from difflib import get_close_matches
+
+from langchain_core.messages import AIMessage
+from pydantic import BaseModel, ValidationError
+
+from story_master.log import logger
+from story_master.metrics import metrics
+
+TOOL_NAME_CUTOFF = 0.8
+
+
+class ToolCallRepairer:
+    """
+    Repairs almost valid tool calls, before the router is asked again.
+    Handles misspelled tool names, malformed json arguments, and tool calls,
+    that the model wrote into the message text instead of the tool call field.
+    Calls, that still don't match a tool schema, are dropped.
+    """
+
+    def __init__(self, tools: list[type[BaseModel]]):
+        self.tools = {tool.__name__: tool for tool in tools}
+        self.fence_pattern = re.compile(r"```(?:json)?(.*?)```", re.DOTALL)
+        self.tool_call_pattern = re.compile(
+            r"<\s*tool_call\s*>(.*?)</\s*tool_call\s*>", re.DOTALL
+        )
+        self.trailing_comma_pattern = re.compile(r",\s*([}\]])")
+
+    def _match_name(self, name: str | None) -> str | None:
+        if not name:
+            return None
+        if name in self.tools:
+            return name
+        matches = get_close_matches(
+            name, self.tools.keys(), n=1, cutoff=TOOL_NAME_CUTOFF
+        )
+        return matches[0] if matches else None
+
+    def _parse_json(self, text: str) -> dict | None:
+        text = text.strip()
+        fence = self.fence_pattern.search(text)
+        if fence:
+            text = fence.group(1).strip()
+        start = text.find("{")
+        end = text.rfind("}")
+        if start == -1 or end < start:
+            return None
+        text = self.trailing_comma_pattern.sub(r"\1", text[start : end + 1])
+        try:
+            value = json.loads(text)
+        except json.JSONDecodeError:
+            return None
+        return value if isinstance(value, dict) else None
+
+    def _create_tool_call(
+        self, name: str | None, args: dict | str | None
+    ) -> dict | None:
+        tool_name = self._match_name(name)
+        if tool_name is None:
+            return None
+        if isinstance(args, str):
+            args = self._parse_json(args) if args.strip() else dict()
+        if args is None:
+            return None
+        try:
+            self.tools[tool_name].model_validate(args)
+        except ValidationError:
+            return None
+        return {
+            "name": tool_name,
+            "args": args,
+            "id": f"call_{uuid.uuid4().hex}",
+            "type": "tool_call",
+        }
+
+    def _get_text_calls(self, content: str) -> list[tuple[str | None, dict | None]]:
+        blocks = self.tool_call_pattern.findall(content) or [content]
+        calls = []
+        for block in blocks:
+            value = self._parse_json(block)
+            if value is None:
+                continue
+            if "function" in value and isinstance(value["function"], dict):
+                value = value["function"]
+            args = value.get("arguments", value.get("args", value.get("parameters")))
+            calls.append((value.get("name"), args or dict()))
+        return calls
+
+    def repair(self, message: AIMessage) -> AIMessage:
+        """
+        Returns the message with valid tool calls only.
+        """
+        tool_calls = []
+        for tool_call in message.tool_calls:
+            if tool_call["name"] in self.tools:
+                try:
+                    self.tools[tool_call["name"]].model_validate(tool_call["args"])
+                    tool_calls.append(tool_call)
+                    continue
+                except ValidationError:
+                    pass
+            repaired = self._create_tool_call(tool_call["name"], tool_call["args"])
+            if repaired is not None:
+                tool_calls.append(repaired)
+
+        if not tool_calls:
+            candidates = [
+                (invalid_call.get("name"), invalid_call.get("args"))
+                for invalid_call in message.invalid_tool_calls
+            ]
+            if isinstance(message.content, str) and message.content:
+                candidates.extend(self._get_text_calls(message.content))
+            for name, args in candidates:
+                repaired = self._create_tool_call(name, args)
+                if repaired is not None:
+                    tool_calls.append(repaired)
+                    break
+
+        if tool_calls == message.tool_calls:
+            return message
+        logger.info(f"Repaired tool calls {message.tool_calls} to {tool_calls}")
+        if tool_calls:
+            metrics.increment("router.repaired_tool_calls")
+        return message.model_copy(
+            update={"tool_calls": tool_calls, "invalid_tool_calls": []}
+        )
@@ -11,6 +11,8 @@ class get_nearby_characters(BaseModel):
 
 
 ANY_TOOL = get_nearby_characters
+# Answered from the storage in memory, the action graph runs them before the first router call
+PREFETCH_TOOLS = [get_nearby_characters]
 
 
 class WorldRetriever:
@@ -20,15 +22,11 @@ class WorldRetriever:
     def get_nearby_characters(self, sim_id: int, radius: int = 3) -> str:
         main_sim = self.storage_handler.get_sim(sim_id)
         position = main_sim.position
-        close_sims = []
-        for (
-            other_sim_id,
-            other_sim,
-        ) in self.storage_handler.character_storage.npc_characters.items():
-            if other_sim_id == sim_id:
-                continue
-            if position.is_close(other_sim.position, radius):
-                close_sims.append(other_sim)
+        close_sims = [
+            other_sim
+            for other_sim in self.storage_handler.get_sims(position, radius)
+            if other_sim.id != sim_id
+        ]
 
         sim_strings = [
             f"<Sim>ID: {sim.id}. Details: {sim.character.get_external_description()}</Sim>"